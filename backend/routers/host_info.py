@@ -7,6 +7,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+from datetime import datetime, timezone
+import asyncio
 import logging
 import json
 import re
@@ -225,21 +227,26 @@ async def get_dashboard_overview(
     # Traccia storage condivisi già contati (per evitare duplicati)
     counted_shared_storage = set()
     
-    for node in nodes:
-        if not node.is_online or node.node_type != "pve":
-            continue
-        
+    pve_nodes = [n for n in nodes if n.is_online and n.node_type == "pve"]
+    
+    # Raccolta dati host in parallelo (solo summary, senza dettagli completi)
+    all_host_details = await host_info_service.get_many([
+        {
+            "hostname": node.hostname,
+            "port": node.ssh_port,
+            "username": node.ssh_user,
+            "key_path": node.ssh_key_path,
+            "include_hardware": True,
+            "include_storage": True,
+            "include_network": False  # Skip network per performance
+        }
+        for node in pve_nodes
+    ])
+    
+    for node, host_details in zip(pve_nodes, all_host_details):
         try:
-            # Raccolta dati host (solo summary, senza dettagli completi)
-            host_details = await host_info_service.get_host_details(
-                hostname=node.hostname,
-                port=node.ssh_port,
-                username=node.ssh_user,
-                key_path=node.ssh_key_path,
-                include_hardware=True,
-                include_storage=True,
-                include_network=False  # Skip network per performance
-            )
+            if isinstance(host_details, Exception):
+                raise host_details
             
             # Aggrega storage (deduplicando storage condivisi)
             node_storage_total = 0.0
@@ -397,22 +404,23 @@ async def get_dashboard_nodes(
         # Se online, aggiungi summary dati
         if node.is_online and node.node_type == "pve":
             try:
-                host_details = await host_info_service.get_host_details(
-                    hostname=node.hostname,
-                    port=node.ssh_port,
-                    username=node.ssh_user,
-                    key_path=node.ssh_key_path,
-                    include_hardware=True,
-                    include_storage=True,
-                    include_network=False
-                )
-                
-                # Conta VM
-                vms = await proxmox_service.get_all_guests(
-                    hostname=node.hostname,
-                    port=node.ssh_port,
-                    username=node.ssh_user,
-                    key_path=node.ssh_key_path
+                # Dettagli host e lista VM sono indipendenti: raccolta concorrente
+                host_details, vms = await asyncio.gather(
+                    host_info_service.get_host_details(
+                        hostname=node.hostname,
+                        port=node.ssh_port,
+                        username=node.ssh_user,
+                        key_path=node.ssh_key_path,
+                        include_hardware=True,
+                        include_storage=True,
+                        include_network=False
+                    ),
+                    proxmox_service.get_all_guests(
+                        hostname=node.hostname,
+                        port=node.ssh_port,
+                        username=node.ssh_user,
+                        key_path=node.ssh_key_path
+                    )
                 )
                 
                 # Calcola storage totale e usato
@@ -478,6 +486,8 @@ async def get_node_metrics(
         username=node.ssh_user,
         key_path=node.ssh_key_path
     )
+    if metrics is None:
+        raise HTTPException(status_code=500, detail="Impossibile raccogliere le metriche del nodo")
     
     metrics["node_id"] = node_id
     metrics["node_name"] = node.name
@@ -498,38 +508,32 @@ async def get_all_nodes_metrics(
     nodes_query = db.query(Node).filter(Node.is_active == True, Node.node_type == "pve", Node.is_online == True)
     nodes = filter_nodes_for_user(db, user, nodes_query).all()
     
-    import asyncio
+    # Stesso timestamp per tutti i nodi del batch
+    timestamp = datetime.now(timezone.utc).isoformat()
     
-    async def get_metrics_for_node(node):
-        try:
-            metrics = await host_info_service.get_node_metrics(
-                hostname=node.hostname,
-                port=node.ssh_port,
-                username=node.ssh_user,
-                key_path=node.ssh_key_path
-            )
-            metrics["node_id"] = node.id
-            metrics["node_name"] = node.name
-            return metrics
-        except Exception as e:
-            logger.error(f"Errore metriche nodo {node.name}: {e}")
-            return {
-                "node_id": node.id,
-                "node_name": node.name,
-                "error": str(e)
-            }
-    
-    # Raccogli metriche in parallelo
-    tasks = [get_metrics_for_node(node) for node in nodes]
-    all_metrics = await asyncio.gather(*tasks, return_exceptions=True)
+    # Raccogli metriche in parallelo, con il fan-out limitato da HostInfoService
+    all_metrics = await host_info_service.get_many_metrics([
+        {
+            "hostname": node.hostname,
+            "port": node.ssh_port,
+            "username": node.ssh_user,
+            "key_path": node.ssh_key_path,
+            "timestamp": timestamp
+        }
+        for node in nodes
+    ])
     
     # Filtra errori
     result = []
-    for metrics in all_metrics:
+    for node, metrics in zip(nodes, all_metrics):
         if isinstance(metrics, Exception):
+            logger.error(f"Errore metriche nodo {node.name}: {metrics}")
+            continue
+        if metrics is None:
             continue
-        if "error" not in metrics:
-            result.append(metrics)
+        metrics["node_id"] = node.id
+        metrics["node_name"] = node.name
+        result.append(metrics)
     
     return result
 
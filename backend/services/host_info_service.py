@@ -3,20 +3,327 @@ Host Info Service - Raccolta informazioni dettagliate host Proxmox
 Ispirato a Proxreporter per raccogliere dati hardware, storage, network, etc.
 """
 
+import asyncio
+import copy
+import hashlib
 import json
 import re
+import shlex
+import time
 import logging
-from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime
+from collections import namedtuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timezone
 
 from services.ssh_service import ssh_service
 
+try:
+    # orjson (opzionale) decodifica gli output JSON di pvesh/pvesm/ip/sensors più velocemente.
+    # orjson.JSONDecodeError deriva da json.JSONDecodeError: le except esistenti restano valide.
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 
+# Divisori per convertire in GB
+_KIB_TO_GB = 1 << 20
+_B_TO_GB = 1 << 30
+
+# Oltre ~10 PB espressi in KiB il valore pvesm è quasi certamente in bytes
+_BYTES_THRESHOLD = 10 << 40
+
+# Riga grezza di `pvesm status --output-format json`, estratta una sola volta
+StorageRaw = namedtuple("StorageRaw", "name type status total used content")
+
+
+def _bytes_or_kib_to_gb(raw: Any) -> Optional[float]:
+    """Converte un valore pvesm (KiB, oppure bytes se oltre soglia) in GB"""
+    if raw is None:
+        return None
+    # Controllo del tipo invece di try/except: niente eccezioni sui valori non numerici
+    if isinstance(raw, (int, float)):
+        value = int(raw)
+    elif isinstance(raw, str) and raw.strip().isdigit():
+        value = int(raw)
+    else:
+        return None
+    return round(value / (_B_TO_GB if value > _BYTES_THRESHOLD else _KIB_TO_GB), 2)
+
+
+def _format_netmask(prefixlen: int) -> str:
+    """Calcola la netmask dotted-quad per un prefixlen 0-32"""
+    if prefixlen == 0:
+        return "0.0.0.0"
+    mask = (0xffffffff >> (32 - prefixlen)) << (32 - prefixlen)
+    return ".".join(str(mask >> shift & 0xff) for shift in (24, 16, 8, 0))
+
+
+# Netmask precalcolate per ogni prefixlen IPv4 (0-32)
+_NETMASKS = tuple(_format_netmask(i) for i in range(33))
+
+# Regex dei parser testuali (pvesm senza JSON, ip addr/ifconfig, dimensioni con unità)
+_PCT_RE = re.compile(r'([\d.,]+)')
+_SIZE_UNIT_RE = re.compile(r'([\d.,]+)\s*([KMGT]?I?B?)$')
+# Numero decimale (virgola o punto), per validare prima di float()
+_NUM_RE = re.compile(r'-?\d+(?:[.,]\d+)?$')
+_MAC_RE = re.compile(r'([0-9a-fA-F]{2}[:-]){5}([0-9a-fA-F]{2})')
+_INET_RE = re.compile(r'inet\s+(\d+\.\d+\.\d+\.\d+)')
+_NETMASK_RE = re.compile(r'netmask\s+(\d+\.\d+\.\d+\.\d+)')
+_CIDR_RE = re.compile(r'/(\d+)')
+# Numero di versione in "pve-manager/8.2.4/... (running kernel: ...)"
+_PVE_VERSION_RE = re.compile(r'\d+\.\d+\.\d+')
+
+# Campi di /proc/meminfo (in KiB) -> campo mem_info (in GB), estratti con una sola regex
+_MEMINFO_FIELDS = {
+    "MemTotal": "total_gb",
+    "MemAvailable": "available_gb",
+    "MemFree": "free_gb",
+    "SwapTotal": "swap_total_gb",
+    "SwapFree": "swap_free_gb",
+}
+_MEMINFO_RE = re.compile(r'^(MemTotal|MemAvailable|MemFree|SwapTotal|SwapFree):\s+(\d+)', re.M)
+
+# Sezioni dmidecode: sottostringa della chiave (lowercase) -> campo hardware_info.
+# Vince la prima corrispondenza, nell'ordine di inserimento.
+_DMI_SECTIONS = {
+    b"System Information": {
+        b"manufacturer": "manufacturer",
+        b"product name": "model",
+        b"version": "version",
+        b"serial number": "serial",
+        b"uuid": "uuid",
+    },
+    b"Base Board Information": {
+        b"manufacturer": "board_manufacturer",
+        b"product name": "board",
+        b"version": "board_version",
+        b"serial number": "board_serial",
+    },
+    b"BIOS Information": {
+        b"vendor": "bios_vendor",
+        b"version": "bios_version",
+        b"release date": "bios_date",
+    },
+}
+_DMI_KV_RE = re.compile(rb'^\s*([^:\n]+):[ \t]*(.*)$', re.M)
+
+# Chiavi di pvesubscription --output-format json -> campo license_info
+_LICENSE_JSON_FIELDS = {
+    "status": "status",
+    "level": "level",
+    "productname": "type",
+    "key": "key",
+    "serverid": "subscription",
+    "checktime": "check_time",
+    "nextduedate": "valid_until",
+    "regdate": "reg_date",
+}
+
+# Chiavi di pvesubscription in formato testo (lowercase, spazi -> _): sottostringa -> campo license_info.
+# L'ordine conta: "status" va prima di "subscription", "key" prima di "serverid".
+_LICENSE_FIELDS = (
+    ("status", "status"),
+    ("level", "level"),
+    ("productname", "type"),
+    ("product_name", "type"),
+    ("key", "key"),
+    ("serverid", "subscription"),
+    ("subscription", "subscription"),
+    ("sockets", "sockets"),
+    ("checktime", "check_time"),
+    ("check_time", "check_time"),
+    ("nextduedate", "valid_until"),
+    ("next_due_date", "valid_until"),
+    ("validuntil", "valid_until"),
+    ("valid_until", "valid_until"),
+    ("regdate", "reg_date"),
+    ("reg_date", "reg_date"),
+)
+# Lookup esatto per le chiavi standard; la ricerca per sottostringa resta per le varianti
+_LICENSE_FIELD_MAP = dict(_LICENSE_FIELDS)
+
+# Numero massimo di letture di temperatura restituite per host
+_MAX_TEMP_READINGS = 20
+
+# Temperature lette direttamente da /sys/class/hwmon con un solo grep (path:valore).
+# Se il kernel non espone sensori hwmon si ricade su sensors -Aj (output JSON).
+_TEMPERATURE_CMD = (
+    't=$(grep -sH . /sys/class/hwmon/hwmon*/temp*_input /sys/class/hwmon/hwmon*/temp*_label '
+    '/sys/class/hwmon/hwmon*/name); '
+    'if [ -n "$t" ]; then echo "$t"; else sensors -Aj 2>/dev/null; fi'
+)
+_HWMON_LINE_RE = re.compile(rb'^/sys/class/hwmon/hwmon(\d+)/(?:temp(\d+)_(input|label)|name):(.*)$', re.M)
+
+# Comandi leggeri che cambiano output solo quando cambiano i dati della sezione
+_FINGERPRINT_CMDS = {
+    # Hardware/BIOS: i dati DMI cambiano solo con un riavvio, che rigenera il boot_id
+    "hardware": "cat /proc/sys/kernel/random/boot_id",
+    # Licenza: cambia se il file di subscription viene riscritto, al massimo ricontrollata ogni giorno
+    "license": "stat -c %Y /etc/subscription 2>/dev/null; date +%F",
+}
+
+# Secondi durante i quali una sezione in cache è restituita senza nemmeno ricalcolare il fingerprint
+_SECTION_TTL = {
+    "license": 300,
+}
+
+# Timeout (secondi) dei comandi remoti di get_host_details: l'intera raccolta batch,
+# i singoli pvesm status al suo interno, e i collector di hardware e licenza
+_HOST_DETAILS_TIMEOUT = 60
+_PVESM_TIMEOUT = 15
+_COLLECTOR_TIMEOUT = 30
+
+# Host interrogati in parallelo da get_many e get_many_metrics: resta sotto il MaxStartups=10 di default
+# di sshd, oltre il quale le nuove connessioni non autenticate vengono rifiutate
+_HOST_DETAILS_CONCURRENCY = 8
+
+# Rete del nodo via pvesh: se il nome del nodo è già noto (fact in cache) viene
+# passato direttamente, altrimenti lo si ricava sul nodo con $(hostname)
+_PVESH_NETWORK_CMD = "pvesh get /nodes/{node}/network --output-format json 2>/dev/null"
+
+# Comandi di get_host_details, eseguiti tutti in un'unica chiamata SSH.
+# Ogni sezione è preceduta dalla riga "==SEC nome" (con newline iniziale, perché
+# l'output del comando precedente può non terminare con un a capo).
+_HOST_SECTION_CMDS = {
+    # hostname, output di pveversion e kernel separati da 0x1f
+    # (Unit Separator) per evitare collisioni con il contenuto
+    "node": "printf '%s\\037%s\\037%s' \"$(hostname)\" \"$(pveversion 2>/dev/null)\" \"$(uname -r)\"",
+    "uptime": "cat /proc/uptime",
+    # Riassunto di /proc/cpuinfo: modello|CPU logiche|socket|core per socket|thread per socket.
+    # Senza "model name" (ARM, alcune VM e container) il modello viene da Processor,
+    # cpu model o Hardware; senza "physical id" il campo socket resta vuoto
+    "cpuinfo": (
+        "awk '{v=$0; sub(/^[^:]*:[ \\t]*/, \"\", v)} "
+        "/^model name/ && m == \"\" {m=v} /^Processor/ && a == \"\" {a=v} "
+        "/^cpu model/ && b == \"\" {b=v} /^Hardware/ && h == \"\" {h=v} /^processor/ {p++} "
+        "/^physical id/ && !(v in s) {s[v]=1; n++} /^cpu cores/ {c=v} /^siblings/ {t=v} "
+        "END {if (m == \"\") m = (a != \"\") ? a : (b != \"\") ? b : h; "
+        "print m \"|\" p \"|\" n \"|\" c \"|\" t}' /proc/cpuinfo"
+    ),
+    "loadavg": "cat /proc/loadavg",
+    "meminfo": "cat /proc/meminfo",
+    "temperature": _TEMPERATURE_CMD,
+    # Configurazione storage per il flag shared, poi pvesm status (JSON o, se non supportato, testo)
+    "storage_config": "pvesh get /storage --output-format json 2>/dev/null",
+    # timeout: con uno storage di rete irraggiungibile pvesm si blocca e fermerebbe tutte le sezioni
+    "pvesm": (
+        f"timeout {_PVESM_TIMEOUT} pvesm status --output-format json 2>/dev/null || "
+        f"timeout {_PVESM_TIMEOUT} pvesm status 2>/dev/null"
+    ),
+    "pvesh_network": _PVESH_NETWORK_CMD.format(node="$(hostname)"),
+    "ip_addr": "ip -j addr show 2>/dev/null || ip addr show 2>/dev/null || ifconfig 2>/dev/null",
+    "routes": "ip -j route show default 2>/dev/null || ip route show default 2>/dev/null",
+    # Fingerprint delle sezioni in cache, per decidere se rieseguirne il collector
+    **{f"fp_{section}": cmd for section, cmd in _FINGERPRINT_CMDS.items()},
+}
+
+# Sezioni di _HOST_SECTION_CMDS richieste da ciascun flag di get_host_details
+_HOST_SECTIONS_BASE = ("uptime", "fp_license")
+_HOST_SECTIONS_HARDWARE = ("loadavg", "meminfo", "temperature", "fp_hardware")
+_HOST_SECTIONS_STORAGE = ("storage_config", "pvesm")
+_HOST_SECTIONS_NETWORK = ("pvesh_network", "ip_addr", "routes")
+
+# Sezioni con dati quasi statici (nome nodo, versioni, modello e topologia CPU):
+# rilette solo dopo _FACT_TTL secondi, e restituite anche scadute se la raccolta fallisce
+_FACT_SECTIONS_BASE = ("node",)
+_FACT_SECTIONS_HARDWARE = ("cpuinfo",)
+_FACT_TTL = 3600
+
+# Metriche lette direttamente da /proc e /sys, parsing lato Python.
+# Unico fork oltre a cat/dd/head: awk per l'interfaccia della route di default,
+# saltato se lo script riceve come argomento un'interfaccia ancora esistente;
+# le statistiche dei dischi sono lette tutte da un solo head -v.
+# /proc/stat e /proc/meminfo vengono letti con una sola read() (dd, buffer 64K):
+# il kernel rigenera il contenuto a ogni read e letture multiple possono essere incoerenti.
+_METRICS_CMD = '''
+net_dev=$1
+[ -n "$net_dev" ] && [ -d "/sys/class/net/$net_dev" ] || net_dev=$(awk '$2 == "00000000" {print $1; exit}' /proc/net/route)
+echo "==STAT"; dd if=/proc/stat bs=65536 count=1 2>/dev/null
+echo "==LOADAVG"; cat /proc/loadavg
+echo "==MEMINFO"; dd if=/proc/meminfo bs=65536 count=1 2>/dev/null
+echo "==NET $net_dev"
+if [ -n "$net_dev" ]; then
+    n=/sys/class/net/$net_dev/statistics
+    cat $n/rx_bytes $n/tx_bytes $n/rx_packets $n/tx_packets 2>/dev/null
+fi
+head -v -n1 /sys/block/sd*/stat /sys/block/nvme*/stat /sys/block/vd*/stat 2>/dev/null || :
+'''
+
+# Copia dello script sul nodo: /run è un tmpfs scrivibile solo da root (a differenza di /tmp)
+# e l'hash nel nome evita di eseguire una versione vecchia dopo un aggiornamento.
+_METRICS_SCRIPT_PATH = f"/run/dapx-metrics-{hashlib.sha1(_METRICS_CMD.encode()).hexdigest()[:8]}.sh"
+
+# Prima esecuzione: salva lo script (errori ignorati, es. utente non root o /run non
+# scrivibile) e lo esegue inline; il marker conferma che la copia sul nodo esiste davvero
+_METRICS_SAVED_MARKER = "__DAPX_METRICS_SAVED__"
+_METRICS_INSTALL_CMD = (
+    f"(umask 077; cat > {_METRICS_SCRIPT_PATH}) 2>/dev/null <<'DAPX_METRICS'"
+    f" && test -s {_METRICS_SCRIPT_PATH} && echo {_METRICS_SAVED_MARKER}"
+    f"{_METRICS_CMD}DAPX_METRICS{_METRICS_CMD}"
+)
+
+# Secondi per cui l'interfaccia di default di un nodo è riusata senza ricalcolarla
+_NET_DEV_TTL = 60
+
+# Struttura restituita da get_host_details, copiata a ogni raccolta
+_HOST_DETAILS_TEMPLATE: Dict[str, Any] = {
+    "hostname": None,
+    "timestamp": None,
+    "cpu": {},
+    "memory": {},
+    "system": {},
+    "storage": [],
+    "network": [],
+    "temperature": {},
+    "license": {}
+}
+
+# Campi di /proc/meminfo usati per le metriche di memoria (in kB)
+_METRICS_MEMINFO_KEYS = frozenset(("MemTotal", "MemAvailable", "MemFree", "Buffers", "Cached"))
+
+# Struttura restituita da get_node_metrics, copiata a ogni raccolta
+_METRICS_TEMPLATE: Dict[str, Any] = {
+    "timestamp": None,
+    "cpu": {
+        "usage_percent": 0.0,
+        "load_1min": 0.0,
+        "load_5min": 0.0,
+        "load_15min": 0.0
+    },
+    "memory": {
+        "usage_percent": 0.0,
+        "used_gb": 0.0,
+        "total_gb": 0.0,
+        "available_gb": 0.0
+    },
+    "network": {
+        "interfaces": []
+    },
+    "disk": {
+        "io_read_bytes": 0,
+        "io_write_bytes": 0,
+        "io_read_ops": 0,
+        "io_write_ops": 0
+    }
+}
+
 
 class HostInfoService:
     """Servizio per raccogliere informazioni dettagliate sugli host Proxmox"""
     
+    def __init__(self):
+        # (hostname, sezione) -> (fingerprint, dati, istante raccolta) per le sezioni quasi statiche
+        self._fingerprints: Dict[Tuple[str, str], Tuple[str, Dict[str, Any], float]] = {}
+        # (hostname, sezione) -> (istante raccolta, dati) per le sezioni di _FACT_SECTIONS_*
+        self._facts: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+        # hostname -> (jiffies totali, jiffies idle) dell'ultimo campione /proc/stat
+        self._prev_cpu: Dict[str, Tuple[int, int]] = {}
+        # (hostname, porta, utente) su cui _METRICS_CMD è già salvato in _METRICS_SCRIPT_PATH
+        self._metrics_script_hosts: Set[Tuple[str, int, str]] = set()
+        # hostname -> (istante rilevazione, interfaccia della route di default)
+        self._net_devs: Dict[str, Tuple[float, str]] = {}
+    
     async def get_host_details(
         self,
         hostname: str,
@@ -31,233 +338,322 @@ class HostInfoService:
         Raccolta informazioni host usando pvesh e comandi SSH.
         Ispirato a Proxreporter.
         """
-        result = {
-            "hostname": hostname,
-            "timestamp": datetime.utcnow().isoformat(),
-            "cpu": {},
-            "memory": {},
-            "system": {},
-            "storage": [],
-            "network": [],
-            "temperature": {},
-            "license": {}
-        }
-        
-        # Info base via pvesh
-        node_info = await self._get_node_info_via_pvesh(hostname, port, username, key_path)
-        if node_info:
-            result.update(node_info)
+        result = copy.deepcopy(_HOST_DETAILS_TEMPLATE)
+        result["hostname"] = hostname
+        result["timestamp"] = datetime.now(timezone.utc).isoformat()
         
-        # CPU info
+        # Dati statici ancora validi in cache: le loro sezioni non vengono rieseguite
+        fact_names = list(_FACT_SECTIONS_BASE)
         if include_hardware:
-            cpu_info = await self._get_cpu_info(hostname, port, username, key_path)
-            if cpu_info:
-                result["cpu"] = cpu_info
-            
-            # Memory info
-            memory_info = await self._get_memory_info(hostname, port, username, key_path)
-            if memory_info:
-                result["memory"] = memory_info
-            
-            # Temperature
-            temp_info = await self._get_temperature_readings(hostname, port, username, key_path)
-            if temp_info:
-                result["temperature"] = temp_info
+            fact_names += _FACT_SECTIONS_HARDWARE
+        facts = {}
+        now = time.monotonic()
+        for name in fact_names:
+            cached = self._facts.get((hostname, name))
+            if cached and now - cached[0] < _FACT_TTL:
+                facts[name] = cached[1]
+        stale = [name for name in fact_names if name not in facts]
         
-        # Storage info
+        # Tutte le altre sezioni richieste in un'unica esecuzione remota
+        names = stale + list(_HOST_SECTIONS_BASE)
+        if include_hardware:
+            names += _HOST_SECTIONS_HARDWARE
         if include_storage:
-            storage_list = await self._get_storage_details(hostname, port, username, key_path)
-            if storage_list:
-                result["storage"] = storage_list
-        
-        # Network info
+            names += _HOST_SECTIONS_STORAGE
         if include_network:
-            network_list = await self._get_network_details(hostname, port, username, key_path)
-            if network_list:
-                result["network"] = network_list
+            names += _HOST_SECTIONS_NETWORK
+        sections = await self._collect_host_sections(
+            hostname, port, username, key_path, names, facts.get("node", {}).get("node_name")
+        )
+        
+        # Sezioni statiche appena lette; se la raccolta fallisce si usa l'ultimo valore noto
+        for name in stale:
+            data = self._parse_fact(name, sections.get(name, b""))
+            if data:
+                facts[name] = data
+                self._facts[(hostname, name)] = (time.monotonic(), data)
+            elif (hostname, name) in self._facts:
+                facts[name] = self._facts[(hostname, name)][1]
+        
+        result.update(await asyncio.to_thread(
+            self._parse_host_sections, hostname, sections, facts, include_hardware, include_storage, include_network
+        ))
         
-        # Hardware info
+        # Hardware e licenza sono in cache: il collector gira solo se il fingerprint è cambiato
+        collectors = {
+            "license": self._get_cached_section(
+                "license", self._get_license_info, sections.get("fp_license", b""),
+                hostname, port, username, key_path
+            )
+        }
         if include_hardware:
-            hardware_info = await self._get_hardware_info(hostname, port, username, key_path)
-            if hardware_info:
-                result["hardware"] = hardware_info
+            collectors["hardware"] = self._get_cached_section(
+                "hardware", self._get_hardware_info, sections.get("fp_hardware", b""),
+                hostname, port, username, key_path
+            )
         
-        # License info
-        license_info = await self._get_license_info(hostname, port, username, key_path)
-        if license_info:
-            result["license"] = license_info
+        values = await asyncio.gather(*collectors.values(), return_exceptions=True)
+        for section, value in zip(collectors, values):
+            if isinstance(value, Exception):
+                logger.error(f"Errore raccolta {section} per {hostname}: {value}")
+            elif value:
+                result[section] = value
         
         return result
     
-    async def _get_node_info_via_pvesh(
+    async def get_many(
+        self,
+        hosts: List[Dict[str, Any]],
+        concurrency: int = _HOST_DETAILS_CONCURRENCY
+    ) -> List[Any]:
+        """
+        Esegue get_host_details su più host in parallelo, al massimo `concurrency` alla volta.
+        Ogni elemento di `hosts` contiene gli argomenti di get_host_details; il risultato
+        mantiene l'ordine di `hosts` e contiene l'eccezione al posto dei dettagli per gli
+        host falliti.
+        """
+        return await self._gather_bounded(self.get_host_details, hosts, concurrency)
+    
+    async def get_many_metrics(
+        self,
+        hosts: List[Dict[str, Any]],
+        concurrency: int = _HOST_DETAILS_CONCURRENCY
+    ) -> List[Any]:
+        """Come get_many, per get_node_metrics (dashboard con tutti i nodi)"""
+        return await self._gather_bounded(self.get_node_metrics, hosts, concurrency)
+    
+    @staticmethod
+    async def _gather_bounded(
+        collect: Callable[..., Awaitable[Any]],
+        hosts: List[Dict[str, Any]],
+        concurrency: int
+    ) -> List[Any]:
+        """Chiama collect(**host) per ogni host, al massimo `concurrency` alla volta"""
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def _one(host: Dict[str, Any]) -> Any:
+            async with semaphore:
+                return await collect(**host)
+        
+        return await asyncio.gather(*(_one(h) for h in hosts), return_exceptions=True)
+    
+    async def _collect_host_sections(
         self,
         hostname: str,
         port: int,
         username: str,
-        key_path: str
-    ) -> Optional[Dict[str, Any]]:
-        """Ottiene info base del nodo via pvesh"""
+        key_path: str,
+        names: List[str],
+        node_name: Optional[str] = None
+    ) -> Dict[str, bytes]:
+        """Esegue le sezioni di _HOST_SECTION_CMDS richieste con una sola chiamata SSH"""
+        commands = _HOST_SECTION_CMDS
+        if node_name:
+            commands = {**commands, "pvesh_network": _PVESH_NETWORK_CMD.format(node=shlex.quote(node_name))}
+        cmd = "\n".join(f"printf '\\n==SEC {name}\\n'; {commands[name]}" for name in names)
         try:
-            # Ottieni hostname del nodo
-            cmd = "hostname"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            node_name = result.stdout.strip() if result.success else hostname
-            
-            # Info versione Proxmox (solo numero versione)
-            cmd = "pveversion 2>/dev/null | grep -oE '[0-9]+\\.[0-9]+\\.[0-9]+' | head -1"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            proxmox_version = result.stdout.strip() if result.success and result.stdout.strip() else None
-            
-            # Kernel version (solo numero)
-            cmd = "uname -r"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            kernel_version = result.stdout.strip() if result.success else None
-            
-            # Uptime
-            cmd = "cat /proc/uptime | awk '{print int($1)}'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            uptime_seconds = int(result.stdout.strip()) if result.success and result.stdout.strip().isdigit() else None
-            
-            return {
-                "node_name": node_name,
-                "proxmox_version": proxmox_version,
-                "kernel_version": kernel_version,
-                "uptime_seconds": uptime_seconds
-            }
+            result = await ssh_service.execute(
+                hostname, cmd, port, username, key_path, timeout=_HOST_DETAILS_TIMEOUT,
+                encoding=None, deadline=_HOST_DETAILS_TIMEOUT
+            )
         except Exception as e:
-            logger.error(f"Errore raccolta info nodo: {e}")
+            logger.error(f"Errore raccolta info host {hostname}: {e}")
+            return {}
+        
+        # L'exit status è quello dell'ultima sezione: conta solo l'output
+        sections = {}
+        for chunk in result.stdout.split(b"\n==SEC ")[1:]:
+            name, _, body = chunk.partition(b"\n")
+            sections[name.decode()] = body
+        return sections
+    
+    def _parse_fact(self, name: str, output: bytes) -> Optional[Dict[str, Any]]:
+        """Parsa una sezione di _FACT_SECTIONS_* (None se vuota o non valida)"""
+        parser = self._parse_node_info if name == "node" else self._parse_cpuinfo
+        try:
+            return parser(output.decode("utf-8", errors="replace")) or None
+        except Exception as e:
+            logger.error(f"Errore parsing sezione {name}: {e}")
             return None
     
-    async def _get_cpu_info(
+    def _parse_host_sections(
         self,
         hostname: str,
-        port: int,
-        username: str,
-        key_path: str
-    ) -> Optional[Dict[str, Any]]:
-        """Ottiene informazioni CPU"""
-        try:
-            # lscpu per info CPU
-            cmd = "lscpu 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if not result.success:
-                return None
-            
-            cpu_info = {}
-            for line in result.stdout.splitlines():
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower().replace(' ', '_')
-                    value = value.strip()
-                    
-                    if 'model_name' in key or 'model name' in key:
-                        cpu_info["model"] = value
-                    elif 'cpu(s)' in key and 'thread' not in key:
-                        try:
-                            cpu_info["cores"] = int(value)
-                        except:
-                            pass
-                    elif 'socket' in key:
-                        try:
-                            cpu_info["sockets"] = int(value)
-                        except:
-                            pass
-                    elif 'thread(s)_per_core' in key or 'thread per core' in key:
-                        try:
-                            cpu_info["threads_per_core"] = int(value)
-                        except:
-                            pass
-            
-            # Calcola threads totali
-            if "cores" in cpu_info and "sockets" in cpu_info:
-                cores_per_socket = cpu_info["cores"] // cpu_info["sockets"] if cpu_info["sockets"] > 0 else cpu_info["cores"]
-                threads_per_core = cpu_info.get("threads_per_core", 1)
-                cpu_info["threads"] = cpu_info["sockets"] * cores_per_socket * threads_per_core
+        sections: Dict[str, bytes],
+        facts: Dict[str, Dict[str, Any]],
+        include_hardware: bool,
+        include_storage: bool,
+        include_network: bool
+    ) -> Dict[str, Any]:
+        """
+        Parsa le sezioni raccolte da _collect_host_sections nei campi di get_host_details.
+        facts contiene i dati statici già parsati (in cache o appena letti).
+        """
+        def text(name: str) -> str:
+            return sections.get(name, b"").decode("utf-8", errors="replace")
+        
+        data = {
+            "node_name": hostname,
+            "proxmox_version": None,
+            "kernel_version": None,
+            **facts.get("node", {}),
+            "uptime_seconds": self._parse_uptime(text("uptime"))
+        }
+        
+        if include_hardware:
+            cpu_info = self._parse_cpu_info(facts.get("cpuinfo"), text("loadavg"))
+            if cpu_info:
+                data["cpu"] = cpu_info
             
-            # Load average
-            cmd = "cat /proc/loadavg | awk '{print $1, $2, $3}'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            if result.success:
-                try:
-                    loads = result.stdout.strip().split()
-                    if len(loads) >= 3:
-                        cpu_info["load_1m"] = float(loads[0])
-                        cpu_info["load_5m"] = float(loads[1])
-                        cpu_info["load_15m"] = float(loads[2])
-                except:
-                    pass
+            memory_info = self._parse_memory_info(text("meminfo"))
+            if memory_info:
+                data["memory"] = memory_info
             
-            return cpu_info if cpu_info else None
-        except Exception as e:
-            logger.error(f"Errore raccolta info CPU: {e}")
-            return None
+            temperature = self._parse_temperature(sections.get("temperature", b""))
+            if temperature:
+                data["temperature"] = temperature
+        
+        if include_storage:
+            storage_list = self._parse_storage(text("storage_config"), text("pvesm"))
+            if storage_list:
+                data["storage"] = storage_list
+        
+        if include_network:
+            network_list = self._parse_network(text("pvesh_network"), text("ip_addr"), text("routes"))
+            if network_list:
+                data["network"] = network_list
+        
+        return data
     
-    async def _get_memory_info(
+    async def _get_cached_section(
         self,
+        section: str,
+        collector,
+        fingerprint_output: bytes,
         hostname: str,
         port: int,
         username: str,
         key_path: str
     ) -> Optional[Dict[str, Any]]:
-        """Ottiene informazioni memoria"""
+        """
+        Esegue il collector solo se il fingerprint della sezione (output di
+        _FINGERPRINT_CMDS, già raccolto insieme alle altre sezioni) è cambiato
+        rispetto all'ultima raccolta, altrimenti restituisce i dati in cache.
+        Entro il TTL della sezione i dati in cache sono restituiti direttamente.
+        """
+        cached = self._fingerprints.get((hostname, section))
+        ttl = _SECTION_TTL.get(section)
+        if cached and ttl and time.monotonic() - cached[2] < ttl:
+            return dict(cached[1])
+        
+        fingerprint = hashlib.sha1(fingerprint_output).hexdigest() if fingerprint_output.strip() else None
+        
+        if fingerprint and cached and cached[0] == fingerprint:
+            self._fingerprints[(hostname, section)] = (fingerprint, cached[1], time.monotonic())
+            return dict(cached[1])
+        
+        data = await collector(hostname, port, username, key_path)
+        if fingerprint and data:
+            self._fingerprints[(hostname, section)] = (fingerprint, data, time.monotonic())
+        return data
+    
+    def _parse_node_info(self, output: str) -> Dict[str, Any]:
+        """Parsa la sezione node: hostname, pveversion e kernel separati da 0x1f"""
+        parts = [p.strip() for p in output.split('\x1f')]
+        if len(parts) != 3 or not parts[0]:
+            return {}
+        node_name, pveversion, kernel_version = parts
+        version_match = _PVE_VERSION_RE.search(pveversion)
+        
+        return {
+            "node_name": node_name,
+            "proxmox_version": version_match.group(0) if version_match else None,
+            "kernel_version": kernel_version or None
+        }
+    
+    def _parse_uptime(self, output: str) -> Optional[int]:
+        """Secondi di uptime dal primo campo di /proc/uptime"""
         try:
-            # MemInfo
-            cmd = "cat /proc/meminfo | grep -E '^MemTotal|^MemAvailable|^MemFree|^SwapTotal|^SwapFree'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if not result.success:
-                return None
-            
-            mem_info = {}
-            for line in result.stdout.splitlines():
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower()
-                    value = int(value.strip().split()[0]) if value.strip().split()[0].isdigit() else 0
-                    
-                    # Converti da KB a GB
-                    value_gb = value / (1024 * 1024)
-                    
-                    if 'memtotal' in key:
-                        mem_info["total_gb"] = round(value_gb, 2)
-                    elif 'memavailable' in key:
-                        mem_info["available_gb"] = round(value_gb, 2)
-                    elif 'memfree' in key:
-                        mem_info["free_gb"] = round(value_gb, 2)
-                    elif 'swaptotal' in key:
-                        mem_info["swap_total_gb"] = round(value_gb, 2)
-                    elif 'swapfree' in key:
-                        mem_info["swap_free_gb"] = round(value_gb, 2)
-            
-            # Calcola used
-            if "total_gb" in mem_info and "available_gb" in mem_info:
-                mem_info["used_gb"] = round(mem_info["total_gb"] - mem_info["available_gb"], 2)
-            
-            if "swap_total_gb" in mem_info and "swap_free_gb" in mem_info:
-                mem_info["swap_used_gb"] = round(mem_info["swap_total_gb"] - mem_info["swap_free_gb"], 2)
-            
+            return int(float(output.split()[0]))
+        except (IndexError, ValueError):
+            return None
+    
+    def _parse_cpu_info(self, cpuinfo: Optional[Dict[str, Any]], loadavg_output: str) -> Optional[Dict[str, Any]]:
+        """Unisce i dati di /proc/cpuinfo (anche in cache) con il load average corrente"""
+        if not cpuinfo:
+            return None
+        
+        cpu_info = dict(cpuinfo)
+        loads = loadavg_output.split()
+        if len(loads) >= 3:
+            try:
+                cpu_info["load_1m"] = float(loads[0])
+                cpu_info["load_5m"] = float(loads[1])
+                cpu_info["load_15m"] = float(loads[2])
+            except ValueError:
+                pass
+        
+        return cpu_info
+    
+    def _parse_cpuinfo(self, output: str) -> Dict[str, Any]:
+        """Parsa la riga modello|CPU logiche|socket|core|siblings prodotta dalla sezione cpuinfo"""
+        parts = [p.strip() for p in output.strip().split('|')]
+        if len(parts) != 5:
+            return {}
+        model, cpus, sockets, cores, siblings = parts
+        
+        cpu_info = {}
+        if model:
+            cpu_info["model"] = model
+        if cpus.isdigit():
+            cpu_info["cores"] = int(cpus)
+        # Nessun "physical id" (ARM, VM, container): un solo socket, come riporta lscpu
+        cpu_info["sockets"] = int(sockets) if sockets.isdigit() and int(sockets) > 0 else 1
+        if cores.isdigit() and siblings.isdigit() and int(cores) > 0:
+            cpu_info["threads_per_core"] = int(siblings) // int(cores)
+        
+        # Calcola threads totali
+        if "cores" in cpu_info and "sockets" in cpu_info:
+            cores_per_socket = cpu_info["cores"] // cpu_info["sockets"] if cpu_info["sockets"] > 0 else cpu_info["cores"]
+            threads_per_core = cpu_info.get("threads_per_core", 1)
+            cpu_info["threads"] = cpu_info["sockets"] * cores_per_socket * threads_per_core
+        
+        return cpu_info
+    
+    def _parse_memory_info(self, output: str) -> Optional[Dict[str, Any]]:
+        """Parsa la sezione meminfo"""
+        try:
+            mem_info = self._parse_meminfo(output)
             return mem_info if mem_info else None
         except Exception as e:
             logger.error(f"Errore raccolta info memoria: {e}")
             return None
     
-    async def _get_storage_details(
-        self,
-        hostname: str,
-        port: int,
-        username: str,
-        key_path: str
-    ) -> List[Dict[str, Any]]:
-        """Ottiene dettagli storage via pvesm"""
+    def _parse_meminfo(self, output: str) -> Dict[str, Any]:
+        """Parsa le righe di /proc/meminfo (valori in KiB)"""
+        # Converti da KB a GB
+        mem_info = {
+            _MEMINFO_FIELDS[key]: round(int(value) / _KIB_TO_GB, 2)
+            for key, value in _MEMINFO_RE.findall(output)
+        }
+        
+        # Calcola used
+        if "total_gb" in mem_info and "available_gb" in mem_info:
+            mem_info["used_gb"] = round(mem_info["total_gb"] - mem_info["available_gb"], 2)
+        
+        if "swap_total_gb" in mem_info and "swap_free_gb" in mem_info:
+            mem_info["swap_used_gb"] = round(mem_info["swap_total_gb"] - mem_info["swap_free_gb"], 2)
+        
+        return mem_info
+    
+    def _parse_storage(self, config_output: str, pvesm_output: str) -> List[Dict[str, Any]]:
+        """Parsa configurazione storage (pvesh) e pvesm status, JSON o testo"""
         try:
-            # Prima ottieni configurazione storage per flag shared
+            # Configurazione storage per flag shared
             storage_config = {}
-            cmd_config = "pvesh get /storage --output-format json 2>/dev/null"
-            config_result = await ssh_service.execute(hostname, cmd_config, port, username, key_path)
-            if config_result.success and config_result.stdout.strip():
+            if config_output.strip():
                 try:
-                    config_list = json.loads(config_result.stdout)
+                    config_list = _json_loads(config_output)
                     for cfg in config_list:
                         name = cfg.get("storage", cfg.get("name", ""))
                         storage_config[name] = {
@@ -267,78 +663,11 @@ class HostInfoService:
                 except json.JSONDecodeError:
                     pass
             
-            # pvesm status per lista storage
-            cmd = "pvesm status --output-format json 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if not result.success or not result.stdout.strip():
-                # Fallback: pvesm status senza JSON
-                cmd = "pvesm status 2>/dev/null"
-                result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-                storage_list = self._parse_pvesm_text(result.stdout) if result.success else []
-                # Aggiungi flag shared dal config
-                for s in storage_list:
-                    cfg = storage_config.get(s.get("name"), {})
-                    s["shared"] = cfg.get("shared", s.get("type") in ["nfs", "cifs", "pbs", "glusterfs", "cephfs", "rbd"])
-                return storage_list
-            
             try:
-                storage_list = json.loads(result.stdout)
-                storage_details = []
-                
-                for storage in storage_list:
-                    name = storage.get("storage", storage.get("name", ""))
-                    stype = storage.get("type", "")
-                    cfg = storage_config.get(name, {})
-                    
-                    # Determina se è condiviso (da config o da tipo)
-                    is_shared = cfg.get("shared", stype in ["nfs", "cifs", "pbs", "glusterfs", "cephfs", "rbd"])
-                    
-                    storage_info = {
-                        "name": name,
-                        "type": stype,
-                        "status": storage.get("status", ""),
-                        "total_gb": None,
-                        "used_gb": None,
-                        "available_gb": None,
-                        "used_percent": None,
-                        "content": storage.get("content", ""),
-                        "shared": is_shared
-                    }
-                    
-                    # pvesm status restituisce valori in KiB (kibibytes)
-                    if storage.get("total"):
-                        try:
-                            total_val = int(storage.get("total", 0))
-                            # Se > 10 PB in KiB (~10 * 1024^4), probabilmente sono bytes
-                            if total_val > 10 * (1024**4):
-                                storage_info["total_gb"] = round(total_val / (1024**3), 2)
-                            else:
-                                storage_info["total_gb"] = round(total_val / (1024 * 1024), 2)
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    if storage.get("used"):
-                        try:
-                            used_val = int(storage.get("used", 0))
-                            if used_val > 10 * (1024**4):
-                                storage_info["used_gb"] = round(used_val / (1024**3), 2)
-                            else:
-                                storage_info["used_gb"] = round(used_val / (1024 * 1024), 2)
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    if storage_info["total_gb"] is not None and storage_info["used_gb"] is not None:
-                        storage_info["available_gb"] = round(storage_info["total_gb"] - storage_info["used_gb"], 2)
-                        if storage_info["total_gb"] > 0:
-                            storage_info["used_percent"] = round((storage_info["used_gb"] / storage_info["total_gb"]) * 100, 2)
-                    
-                    storage_details.append(storage_info)
-                
-                return storage_details
+                return self._parse_pvesm_json(pvesm_output, storage_config)
             except json.JSONDecodeError:
-                # Fallback a parsing testo
-                storage_list = self._parse_pvesm_text(result.stdout)
+                # pvesm senza --output-format: parsing testo
+                storage_list = self._parse_pvesm_text(pvesm_output)
                 for s in storage_list:
                     cfg = storage_config.get(s.get("name"), {})
                     s["shared"] = cfg.get("shared", s.get("type") in ["nfs", "cifs", "pbs", "glusterfs", "cephfs", "rbd"])
@@ -347,19 +676,64 @@ class HostInfoService:
             logger.error(f"Errore raccolta storage: {e}")
             return []
     
+    def _parse_pvesm_json(self, output: str, storage_config: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Parse output JSON pvesm status (solleva JSONDecodeError se non è JSON)"""
+        rows = [
+            StorageRaw(
+                s.get("storage") or s.get("name", ""),
+                s.get("type", ""),
+                s.get("status", ""),
+                s.get("total"),
+                s.get("used"),
+                s.get("content", "")
+            )
+            for s in _json_loads(output)
+        ]
+        storage_details = []
+        
+        for row in rows:
+            cfg = storage_config.get(row.name, {})
+            
+            # Determina se è condiviso (da config o da tipo)
+            is_shared = cfg.get("shared", row.type in ["nfs", "cifs", "pbs", "glusterfs", "cephfs", "rbd"])
+            
+            # pvesm status restituisce valori in KiB (kibibytes)
+            total_gb = _bytes_or_kib_to_gb(row.total)
+            used_gb = _bytes_or_kib_to_gb(row.used)
+            available_gb = None
+            used_percent = None
+            if total_gb is not None and used_gb is not None:
+                available_gb = round(total_gb - used_gb, 2)
+                if total_gb > 0:
+                    used_percent = round((used_gb / total_gb) * 100, 2)
+            
+            storage_details.append({
+                "name": row.name,
+                "type": row.type,
+                "status": row.status,
+                "total_gb": total_gb,
+                "used_gb": used_gb,
+                "available_gb": available_gb,
+                "used_percent": used_percent,
+                "content": row.content,
+                "shared": is_shared
+            })
+        
+        return storage_details
+    
     def _parse_pvesm_text(self, output: str) -> List[Dict[str, Any]]:
         """Parse output testo pvesm status (valori in KiB)"""
         storage_details = []
-        lines = [line.strip() for line in output.splitlines() if line.strip()]
+        lines = filter(None, map(str.strip, output.splitlines()))
         
         # Skip header
-        for line in lines[1:]:
-            parts = re.split(r'\s+', line)
+        next(lines, None)
+        for line in lines:
+            parts = line.split(None, 6)
             if len(parts) < 7:
                 continue
             
-            name, stype, status = parts[0], parts[1], parts[2]
-            total_raw, used_raw, avail_raw, percent_raw = parts[3], parts[4], parts[5], parts[6]
+            name, stype, status, total_raw, used_raw, avail_raw, percent_raw = parts
             
             # pvesm status output è in KiB - converti in GB
             storage_info = {
@@ -373,17 +747,20 @@ class HostInfoService:
                 "content": ""
             }
             
-            # Parse percent
-            percent_match = re.search(r'([\d.,]+)', percent_raw)
-            if percent_match:
-                try:
-                    storage_info["used_percent"] = float(percent_match.group(1).replace(',', '.'))
-                except:
-                    pass
-            
-            if storage_info["total_gb"] and storage_info["used_gb"]:
-                if storage_info["total_gb"] > 0:
-                    storage_info["used_percent"] = round((storage_info["used_gb"] / storage_info["total_gb"]) * 100, 2)
+            # Percentuale calcolata dai valori (anche se zero); la colonna % di pvesm solo se mancano
+            total_gb, used_gb = storage_info["total_gb"], storage_info["used_gb"]
+            if total_gb is not None and used_gb is not None:
+                if storage_info["available_gb"] is None:
+                    storage_info["available_gb"] = round(total_gb - used_gb, 2)
+                if total_gb > 0:
+                    storage_info["used_percent"] = round((used_gb / total_gb) * 100, 2)
+            else:
+                percent_match = _PCT_RE.search(percent_raw)
+                if percent_match:
+                    try:
+                        storage_info["used_percent"] = float(percent_match.group(1).replace(',', '.'))
+                    except ValueError:
+                        pass
             
             storage_details.append(storage_info)
         
@@ -393,12 +770,11 @@ class HostInfoService:
         """Converte KiB in GB. pvesm status restituisce sempre valori in KiB."""
         if not value:
             return None
-        try:
-            kib = float(str(value).strip().replace(',', '.'))
-            # KiB -> GB: dividi per 1024^2
-            return round(kib / (1024 * 1024), 2)
-        except ValueError:
+        value = str(value).strip()
+        if not _NUM_RE.match(value):
             return None
+        # KiB -> GB: dividi per 1024^2
+        return round(float(value.replace(',', '.')) / _KIB_TO_GB, 2)
     
     def _safe_parse_size(self, value: str, default_unit: str = 'B') -> Optional[float]:
         """
@@ -412,24 +788,31 @@ class HostInfoService:
         if not value:
             return None
         
+        # Fast path: intero puro (caso comune di pvesm), nessuna regex
+        if isinstance(value, int) or (isinstance(value, str) and value.strip().isdigit()):
+            divisor = _KIB_TO_GB if default_unit == 'K' else _B_TO_GB
+            return round(int(value) / divisor, 2)
+        
         # Rimuovi spazi e converti in stringa
         value = str(value).strip().upper()
         
         # Se contiene unità, estraila
-        unit_match = re.search(r'([\d.,]+)\s*([KMGT]?I?B?)$', value)
+        unit_match = _SIZE_UNIT_RE.search(value)
         if unit_match:
             numeric_str = unit_match.group(1).replace(',', '.')
             unit = unit_match.group(2) or default_unit
+            if not _NUM_RE.match(numeric_str):
+                return None
             try:
                 numeric = float(numeric_str)
                 
                 # Converti in GB
                 if not unit or unit in ['B', 'BYTES']:
                     # Bytes -> GB
-                    return round(numeric / (1024**3), 2)
+                    return round(numeric / _B_TO_GB, 2)
                 elif unit.startswith('K'):
                     # KiB -> GB
-                    return round(numeric / (1024 * 1024), 2)
+                    return round(numeric / _KIB_TO_GB, 2)
                 elif unit.startswith('M'):
                     # MiB -> GB
                     return round(numeric / 1024, 2)
@@ -442,43 +825,33 @@ class HostInfoService:
                 else:
                     # Default: usa l'unità di default
                     if default_unit == 'K':
-                        return round(numeric / (1024 * 1024), 2)
+                        return round(numeric / _KIB_TO_GB, 2)
                     else:
-                        return round(numeric / (1024**3), 2)
+                        return round(numeric / _B_TO_GB, 2)
             except ValueError:
                 return None
         else:
             # Nessuna unità esplicita
+            if not _NUM_RE.match(value):
+                return None
             try:
                 numeric = float(value.replace(',', '.'))
                 if default_unit == 'K':
                     # Assume KiB
-                    return round(numeric / (1024 * 1024), 2)
+                    return round(numeric / _KIB_TO_GB, 2)
                 else:
                     # Assume bytes
-                    return round(numeric / (1024**3), 2)
+                    return round(numeric / _B_TO_GB, 2)
             except ValueError:
                 return None
     
-    async def _get_network_details(
-        self,
-        hostname: str,
-        port: int,
-        username: str,
-        key_path: str
-    ) -> List[Dict[str, Any]]:
-        """Ottiene dettagli network via pvesh e ip/ifconfig"""
+    def _parse_network(self, pvesh_output: str, addr_output: str, routes_output: str) -> List[Dict[str, Any]]:
+        """Parsa configurazione pvesh, indirizzi (ip -j, ip addr o ifconfig) e route di default"""
         try:
-            network_details = []
-            
-            # Prima ottieni configurazione base da pvesh
-            cmd = "pvesh get /nodes/$(hostname)/network --output-format json 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
             pvesh_interfaces = {}
-            if result.success and result.stdout.strip():
+            if pvesh_output.strip():
                 try:
-                    network_list = json.loads(result.stdout)
+                    network_list = _json_loads(pvesh_output)
                     for iface in network_list:
                         iface_name = iface.get("iface", "")
                         if iface_name:
@@ -486,109 +859,92 @@ class HostInfoService:
                 except json.JSONDecodeError:
                     pass
             
-            # Ottieni informazioni dettagliate da ip addr
-            cmd = "ip -j addr show 2>/dev/null || ip addr show 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if not result.success:
-                # Fallback a ifconfig
-                cmd = "ifconfig 2>/dev/null || ip addr show 2>/dev/null"
-                result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if not result.success:
+            if not addr_output.strip():
                 return []
             
+            gw_by_dev, default_gw = self._parse_default_routes(routes_output) if routes_output.strip() else ({}, None)
+            
             # Prova a parsare JSON (ip -j)
             try:
-                ip_data = json.loads(result.stdout)
-                for iface_data in ip_data:
-                    iface_name = iface_data.get("ifname", "")
-                    if not iface_name or iface_name == "lo":
-                        continue
-                    
-                    iface_info = {
-                        "name": iface_name,
-                        "type": pvesh_interfaces.get(iface_name, {}).get("type", "ethernet"),
-                        "status": "UP" if iface_data.get("operstate") == "UP" else "DOWN",
-                        "mac": iface_data.get("address", ""),
-                        "ip": None,
-                        "netmask": None,
-                        "gateway": None,
-                        "bridge": pvesh_interfaces.get(iface_name, {}).get("bridge", ""),
-                        "vlan_id": pvesh_interfaces.get(iface_name, {}).get("vlan-raw-device", ""),
-                        "bond_mode": pvesh_interfaces.get(iface_name, {}).get("bond_mode", ""),
-                        "comment": pvesh_interfaces.get(iface_name, {}).get("comments", "")
-                    }
-                    
-                    # Estrai IP e netmask dal primo indirizzo IPv4
-                    addr_info = iface_data.get("addr_info", [])
-                    for addr in addr_info:
-                        if addr.get("family") == "inet":
-                            iface_info["ip"] = addr.get("local", "")
-                            prefixlen = addr.get("prefixlen", 0)
-                            if prefixlen:
-                                # Converti prefixlen in netmask
-                                iface_info["netmask"] = self._prefixlen_to_netmask(prefixlen)
-                            break
-                    
-                    # Filtra interfacce DOWN
-                    if iface_info.get("status", "").upper() == "DOWN":
-                        continue
-                    
-                    # Ottieni gateway per questa interfaccia
-                    gateway = await self._get_interface_gateway(hostname, port, username, key_path, iface_name)
-                    if gateway:
-                        iface_info["gateway"] = gateway
-                    
-                    network_details.append(iface_info)
-                
-                return network_details
+                network_details = self._parse_ip_json(addr_output, pvesh_interfaces)
             except (json.JSONDecodeError, KeyError):
                 # Fallback: parsing testo (ifconfig o ip addr senza -j)
-                network_details = self._parse_network_text(result.stdout, pvesh_interfaces)
-                # Filtra interfacce DOWN e aggiungi gateway per quelle attive
-                filtered_details = []
-                for iface_info in network_details:
-                    status = iface_info.get("status", "").upper()
-                    state = iface_info.get("state", "").lower()
-                    # Salta interfacce DOWN
-                    if status == "DOWN" or state == "down":
-                        continue
-                    
-                    gateway = await self._get_interface_gateway(hostname, port, username, key_path, iface_info["name"])
-                    if gateway:
-                        iface_info["gateway"] = gateway
-                    filtered_details.append(iface_info)
-                return filtered_details
+                network_details = self._parse_network_text(addr_output, pvesh_interfaces)
+            
+            # Le interfacce DOWN sono già escluse dai parser
+            for iface_info in network_details:
+                iface_info["gateway"] = gw_by_dev.get(iface_info["name"], default_gw)
+            return network_details
         except Exception as e:
             logger.error(f"Errore raccolta network: {e}")
             return []
     
+    def _parse_ip_json(self, output: str, pvesh_interfaces: Dict) -> List[Dict[str, Any]]:
+        """Parsa output JSON di ip -j addr (solleva JSONDecodeError se non è JSON)"""
+        network_details = []
+        for iface_data in _json_loads(output):
+            iface_name = iface_data.get("ifname", "")
+            if not iface_name or iface_name == "lo":
+                continue
+            
+            # Filtra interfacce DOWN prima di costruire il record
+            if iface_data.get("operstate") != "UP":
+                continue
+            
+            iface_info = {
+                "name": iface_name,
+                "type": pvesh_interfaces.get(iface_name, {}).get("type", "ethernet"),
+                "status": "UP",
+                "mac": iface_data.get("address", ""),
+                "ip": None,
+                "netmask": None,
+                "gateway": None,
+                "bridge": pvesh_interfaces.get(iface_name, {}).get("bridge", ""),
+                "vlan_id": pvesh_interfaces.get(iface_name, {}).get("vlan-raw-device", ""),
+                "bond_mode": pvesh_interfaces.get(iface_name, {}).get("bond_mode", ""),
+                "comment": pvesh_interfaces.get(iface_name, {}).get("comments", "")
+            }
+            
+            # Estrai IP e netmask dal primo indirizzo IPv4
+            v4 = next((a for a in iface_data.get("addr_info") or () if a.get("family") == "inet"), None)
+            if v4:
+                iface_info["ip"] = v4.get("local", "")
+                prefixlen = v4.get("prefixlen")
+                iface_info["netmask"] = self._prefixlen_to_netmask(prefixlen) if prefixlen else None
+            
+            network_details.append(iface_info)
+        
+        return network_details
+    
     def _prefixlen_to_netmask(self, prefixlen: int) -> str:
         """Converte prefixlen (CIDR) in netmask"""
-        try:
-            mask = (0xffffffff >> (32 - prefixlen)) << (32 - prefixlen)
-            return f"{mask >> 24 & 0xff}.{mask >> 16 & 0xff}.{mask >> 8 & 0xff}.{mask & 0xff}"
-        except:
-            return f"/{prefixlen}"
+        if isinstance(prefixlen, int) and 0 <= prefixlen <= 32:
+            return _NETMASKS[prefixlen]
+        return f"/{prefixlen}"
     
-    async def _get_interface_gateway(self, hostname: str, port: int, username: str, key_path: str, iface: str) -> Optional[str]:
-        """Ottiene il gateway per un'interfaccia"""
+    def _parse_default_routes(self, output: str) -> Tuple[Dict[str, str], Optional[str]]:
+        """Parsa le route di default (ip -j route o testo) in {dev: gateway} + gateway principale"""
+        gw_by_dev: Dict[str, str] = {}
+        default_gw = None
         try:
-            # Prova a ottenere il gateway dalla route table
-            cmd = f"ip route show dev {iface} | grep default | head -1 | awk '{{print $3}}'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            if result.success and result.stdout.strip():
-                return result.stdout.strip()
-            
-            # Fallback: gateway principale
-            cmd = "ip route | grep default | head -1 | awk '{print $3}'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            if result.success and result.stdout.strip():
-                return result.stdout.strip()
-        except:
-            pass
-        return None
+            routes = [
+                (r["dev"], r["gateway"])
+                for r in _json_loads(output)
+                if r.get("dst") == "default" and "gateway" in r and "dev" in r
+            ]
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            # Formato testo: default via 192.168.1.1 dev vmbr0 ...
+            routes = []
+            for line in output.splitlines():
+                parts = line.split()
+                if len(parts) >= 5 and parts[0] == "default" and parts[1] == "via" and "dev" in parts:
+                    routes.append((parts[parts.index("dev") + 1], parts[2]))
+        
+        for dev, gateway in routes:
+            gw_by_dev.setdefault(dev, gateway)
+            if default_gw is None:
+                default_gw = gateway
+        return gw_by_dev, default_gw
     
     def _parse_network_text(self, text: str, pvesh_interfaces: Dict) -> List[Dict[str, Any]]:
         """Parsa output testo di ifconfig o ip addr"""
@@ -602,10 +958,14 @@ class HostInfoService:
                 parts = line.split(':')
                 iface_name = parts[0].strip()
                 if iface_name and iface_name != "lo":
+                    # Interfacce DOWN scartate subito, insieme alle loro righe di dettaglio
+                    if "UP" not in line:
+                        current_iface = None
+                        continue
                     current_iface = {
                         "name": iface_name,
                         "type": pvesh_interfaces.get(iface_name, {}).get("type", "ethernet"),
-                        "status": "UP" if "UP" in line or "state UP" in line else "DOWN",
+                        "status": "UP",
                         "mac": "",
                         "ip": None,
                         "netmask": None,
@@ -616,23 +976,23 @@ class HostInfoService:
                         "comment": pvesh_interfaces.get(iface_name, {}).get("comments", "")
                     }
                     # Estrai MAC
-                    mac_match = re.search(r'([0-9a-fA-F]{2}[:-]){5}([0-9a-fA-F]{2})', line)
+                    mac_match = _MAC_RE.search(line)
                     if mac_match:
                         current_iface["mac"] = mac_match.group(0)
             elif current_iface:
                 # IP address line
                 # ifconfig: inet 192.168.1.1  netmask 255.255.255.0
                 # ip addr: inet 192.168.1.1/24
-                ip_match = re.search(r'inet\s+(\d+\.\d+\.\d+\.\d+)', line)
+                ip_match = _INET_RE.search(line)
                 if ip_match:
                     current_iface["ip"] = ip_match.group(1)
                     # Netmask
-                    netmask_match = re.search(r'netmask\s+(\d+\.\d+\.\d+\.\d+)', line)
+                    netmask_match = _NETMASK_RE.search(line)
                     if netmask_match:
                         current_iface["netmask"] = netmask_match.group(1)
                     else:
                         # CIDR format: 192.168.1.1/24
-                        cidr_match = re.search(r'/(\d+)', line)
+                        cidr_match = _CIDR_RE.search(line)
                         if cidr_match:
                             prefixlen = int(cidr_match.group(1))
                             current_iface["netmask"] = self._prefixlen_to_netmask(prefixlen)
@@ -647,68 +1007,92 @@ class HostInfoService:
         if current_iface and current_iface.get("name"):
             network_details.append(current_iface)
         
-        # Filtra interfacce DOWN prima di restituire
-        filtered_details = []
-        for iface in network_details:
-            status = iface.get("status", "").upper()
-            state = iface.get("state", "").lower()
-            # Salta interfacce DOWN
-            if status != "DOWN" and state != "down":
-                filtered_details.append(iface)
-        
-        return filtered_details
+        return network_details
     
-    async def _get_temperature_readings(
-        self,
-        hostname: str,
-        port: int,
-        username: str,
-        key_path: str
-    ) -> Optional[Dict[str, Any]]:
-        """Ottiene letture temperatura"""
+    def _parse_temperature(self, output: bytes) -> Optional[Dict[str, Any]]:
+        """Parsa la sezione temperature: righe hwmon o, in fallback, JSON di sensors -Aj"""
         try:
-            # sensors -Aj per JSON
-            cmd = "sensors -Aj 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            readings = []
-            highest = None
-            
-            if result.success and result.stdout.strip():
-                try:
-                    data = json.loads(result.stdout)
-                    for chip_name, chip_data in data.items():
-                        if not isinstance(chip_data, dict):
-                            continue
-                        for sensor_name, sensor_values in chip_data.items():
-                            if not isinstance(sensor_values, dict):
-                                continue
-                            for key, value in sensor_values.items():
-                                if key.endswith("_input"):
-                                    try:
-                                        temp_val = float(value)
-                                        readings.append({
-                                            "chip": chip_name,
-                                            "sensor": sensor_name,
-                                            "temperature_c": round(temp_val, 1)
-                                        })
-                                        highest = temp_val if highest is None else max(highest, temp_val)
-                                    except (TypeError, ValueError):
-                                        pass
-                except json.JSONDecodeError:
-                    pass
-            
-            if readings:
-                return {
-                    "readings": readings[:20],  # Limita a 20
-                    "highest_c": round(highest, 1) if highest else None
-                }
-            
-            return None
+            if not output.strip():
+                return None
+            if output.lstrip().startswith(b"{"):
+                return self._parse_sensors(output)
+            return self._parse_hwmon(output)
         except Exception as e:
             logger.error(f"Errore raccolta temperatura: {e}")
             return None
     
+    def _parse_hwmon(self, output: bytes) -> Optional[Dict[str, Any]]:
+        """Parsa le righe path:valore di /sys/class/hwmon (temperature in millesimi di grado)"""
+        chips: Dict[int, str] = {}
+        labels: Dict[Tuple[int, int], str] = {}
+        values: Dict[Tuple[int, int], float] = {}
+        
+        for hwmon, temp, kind, value in _HWMON_LINE_RE.findall(output):
+            hwmon = int(hwmon)
+            if not temp:
+                chips[hwmon] = value.decode(errors="replace").strip()
+            elif kind == b"label":
+                labels[(hwmon, int(temp))] = value.decode(errors="replace").strip()
+            else:
+                try:
+                    values[(hwmon, int(temp))] = int(value) / 1000
+                except ValueError:
+                    continue
+        
+        return self._summarize_temperatures(
+            (chips.get(hwmon, f"hwmon{hwmon}"), labels.get((hwmon, temp), f"temp{temp}"), values[(hwmon, temp)])
+            for hwmon, temp in sorted(values)
+        )
+    
+    def _parse_sensors(self, output: bytes) -> Optional[Dict[str, Any]]:
+        """Parsa output JSON di sensors -Aj (bytes, decodificati direttamente da json.loads)"""
+        samples = []
+        
+        try:
+            data = _json_loads(output)
+            for chip_name, chip_data in data.items():
+                if not isinstance(chip_data, dict):
+                    continue
+                for sensor_name, sensor_values in chip_data.items():
+                    if not isinstance(sensor_values, dict):
+                        continue
+                    for key, value in sensor_values.items():
+                        if not key.endswith("_input"):
+                            continue
+                        try:
+                            samples.append((chip_name, sensor_name, float(value)))
+                        except (TypeError, ValueError):
+                            continue
+        except ValueError:
+            # JSON non valido o non UTF-8
+            pass
+        
+        return self._summarize_temperatures(samples)
+    
+    def _summarize_temperatures(self, samples) -> Optional[Dict[str, Any]]:
+        """Costruisce letture e massimo da tuple (chip, sensore, gradi C)"""
+        readings = []
+        highest = None
+        
+        for chip_name, sensor_name, temp_val in samples:
+            # Massimo su tutti i sensori, ma al più _MAX_TEMP_READINGS letture restituite
+            if highest is None or temp_val > highest:
+                highest = temp_val
+            if len(readings) < _MAX_TEMP_READINGS:
+                readings.append({
+                    "chip": chip_name,
+                    "sensor": sensor_name,
+                    "temperature_c": round(temp_val, 1)
+                })
+        
+        if readings:
+            return {
+                "readings": readings,
+                "highest_c": round(highest, 1) if highest else None
+            }
+        
+        return None
+    
     async def _get_hardware_info(
         self,
         hostname: str,
@@ -718,74 +1102,47 @@ class HostInfoService:
     ) -> Optional[Dict[str, Any]]:
         """Ottiene informazioni hardware (DMIDECODE)"""
         try:
-            hardware_info = {}
-            
-            # dmidecode per info hardware
-            # Prova prima con dmidecode
-            cmd = "dmidecode -t system 2>/dev/null | grep -E 'Manufacturer|Product Name|Version|Serial Number|UUID'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if result.success:
-                for line in result.stdout.splitlines():
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower()
-                        value = value.strip()
-                        
-                        if 'manufacturer' in key:
-                            hardware_info["manufacturer"] = value
-                        elif 'product name' in key:
-                            hardware_info["model"] = value
-                        elif 'version' in key:
-                            hardware_info["version"] = value
-                        elif 'serial number' in key:
-                            hardware_info["serial"] = value
-                        elif 'uuid' in key:
-                            hardware_info["uuid"] = value
-            
-            # Board info
-            cmd = "dmidecode -t baseboard 2>/dev/null | grep -E 'Manufacturer|Product Name|Version|Serial Number'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
-            
-            if result.success:
-                for line in result.stdout.splitlines():
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower()
-                        value = value.strip()
-                        
-                        if 'manufacturer' in key and 'board' not in key:
-                            hardware_info["board_manufacturer"] = value
-                        elif 'product name' in key:
-                            hardware_info["board"] = value
-                        elif 'version' in key:
-                            hardware_info["board_version"] = value
-                        elif 'serial number' in key:
-                            hardware_info["board_serial"] = value
+            # Sistema, scheda madre e BIOS in un'unica invocazione di dmidecode
+            cmd = "dmidecode -t system -t baseboard -t bios 2>/dev/null"
+            result = await ssh_service.execute(
+                hostname, cmd, port, username, key_path, timeout=_COLLECTOR_TIMEOUT,
+                encoding=None, deadline=_COLLECTOR_TIMEOUT
+            )
             
-            # BIOS info
-            cmd = "dmidecode -t bios 2>/dev/null | grep -E 'Vendor|Version|Release Date'"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
+            if not result.success:
+                return None
             
-            if result.success:
-                for line in result.stdout.splitlines():
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip().lower()
-                        value = value.strip()
-                        
-                        if 'vendor' in key:
-                            hardware_info["bios_vendor"] = value
-                        elif 'version' in key:
-                            hardware_info["bios_version"] = value
-                        elif 'release date' in key:
-                            hardware_info["bios_date"] = value
+            hardware_info = await asyncio.to_thread(self._parse_dmidecode, result.stdout)
             
             return hardware_info if hardware_info else None
         except Exception as e:
             logger.error(f"Errore raccolta info hardware: {e}")
             return None
     
+    def _parse_dmidecode(self, output: bytes) -> Dict[str, Any]:
+        """
+        Parsa le sezioni System/Base Board/BIOS Information di dmidecode.
+        Lavora sui bytes grezzi: si decodificano solo i valori estratti.
+        """
+        hardware_info = {}
+        
+        # Ogni struttura DMI inizia con "Handle ...", seguita dal titolo della sezione
+        for block in (b"\n" + output).split(b"\nHandle "):
+            _, _, body = block.partition(b"\n")
+            title, _, body = body.partition(b"\n")
+            field_map = _DMI_SECTIONS.get(title.strip())
+            if field_map is None:
+                continue
+            
+            for match in _DMI_KV_RE.finditer(body):
+                key = match.group(1).lower()
+                for needle, field in field_map.items():
+                    if needle in key:
+                        hardware_info[field] = match.group(2).strip().decode('utf-8', errors='replace')
+                        break
+        
+        return hardware_info
+    
     async def _get_license_info(
         self,
         hostname: str,
@@ -795,189 +1152,228 @@ class HostInfoService:
     ) -> Optional[Dict[str, Any]]:
         """Ottiene informazioni licenza Proxmox complete"""
         try:
-            cmd = "pvesubscription get 2>/dev/null"
-            result = await ssh_service.execute(hostname, cmd, port, username, key_path)
+            cmd = "pvesubscription get --output-format json 2>/dev/null"
+            result = await ssh_service.execute(
+                hostname, cmd, port, username, key_path, timeout=_COLLECTOR_TIMEOUT, deadline=_COLLECTOR_TIMEOUT
+            )
+            
+            if not result.success:
+                # Versioni Proxmox senza --output-format: output testo chiave: valore
+                cmd = "pvesubscription get 2>/dev/null"
+                result = await ssh_service.execute(
+                    hostname, cmd, port, username, key_path, timeout=_COLLECTOR_TIMEOUT, deadline=_COLLECTOR_TIMEOUT
+                )
             
             if not result.success:
                 return None
             
-            license_info = {}
-            for line in result.stdout.splitlines():
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().lower().replace(' ', '_')
-                    value = value.strip()
-                    
-                    if 'status' in key:
-                        license_info["status"] = value
-                    elif 'level' in key:
-                        license_info["level"] = value
-                    elif 'productname' in key or 'product_name' in key:
-                        license_info["type"] = value
-                    elif 'key' in key and 'serverid' not in key:
-                        license_info["key"] = value
-                    elif 'serverid' in key or 'subscription' in key:
-                        license_info["subscription"] = value
-                    elif 'sockets' in key:
-                        try:
-                            license_info["sockets"] = int(value)
-                        except:
-                            license_info["sockets"] = value
-                    elif 'checktime' in key or 'check_time' in key:
-                        license_info["check_time"] = value
-                    elif 'nextduedate' in key or 'next_due_date' in key or 'validuntil' in key or 'valid_until' in key:
-                        license_info["valid_until"] = value
-                    elif 'regdate' in key or 'reg_date' in key:
-                        license_info["reg_date"] = value
+            license_info = await asyncio.to_thread(self._parse_license, result.stdout)
             
             return license_info if license_info else None
         except Exception as e:
             logger.error(f"Errore raccolta info licenza: {e}")
             return None
     
+    def _parse_license(self, output: str) -> Dict[str, Any]:
+        """Parsa output di pvesubscription get (JSON, con fallback al formato testo)"""
+        try:
+            data = _json_loads(output)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            license_info = {
+                field: str(data[json_key])
+                for json_key, field in _LICENSE_JSON_FIELDS.items()
+                if data.get(json_key) not in (None, "")
+            }
+            if "sockets" in data:
+                license_info["sockets"] = data["sockets"]
+            return license_info
+        
+        license_info = {}
+        for line in output.split('\n'):
+            head, sep, tail = line.partition(':')
+            if not sep:
+                continue
+            key = head.strip().lower().replace(' ', '_')
+            value = tail.strip()
+            
+            field = _LICENSE_FIELD_MAP.get(key)
+            if field is None:
+                field = next((f for needle, f in _LICENSE_FIELDS if needle in key), None)
+                if field is None:
+                    continue
+            if field == "sockets":
+                value = int(value) if value.isdigit() else value
+            license_info[field] = value
+        
+        return license_info
+    
     async def get_node_metrics(
         self,
         hostname: str,
         port: int = 22,
         username: str = "root",
-        key_path: str = "/root/.ssh/id_rsa"
-    ) -> Dict[str, Any]:
+        key_path: str = "/root/.ssh/id_rsa",
+        timestamp: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
         """
         Raccolta metriche di performance in tempo reale:
         - CPU usage (%)
         - RAM usage (%)
         - Network I/O (bytes in/out)
         - Disk I/O (read/write)
-        """
-        metrics = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "cpu": {
-                "usage_percent": 0.0,
-                "load_1min": 0.0,
-                "load_5min": 0.0,
-                "load_15min": 0.0
-            },
-            "memory": {
-                "usage_percent": 0.0,
-                "used_gb": 0.0,
-                "total_gb": 0.0,
-                "available_gb": 0.0
-            },
-            "network": {
-                "interfaces": []
-            },
-            "disk": {
-                "io_read_bytes": 0,
-                "io_write_bytes": 0,
-                "io_read_ops": 0,
-                "io_write_ops": 0
-            }
-        }
         
+        timestamp può essere passato dal chiamante che interroga più nodi,
+        così viene formattato una sola volta per tutto il batch.
+        Restituisce None se le metriche non sono state raccolte.
+        """
         try:
-            # Script batch per raccogliere tutte le metriche in una chiamata
-            metrics_cmd = '''
-# CPU usage e load
-cpu_info=$(top -bn1 | grep "Cpu(s)" | sed "s/.*, *\\([0-9.]*\\)%* id.*/\\1/" | awk '{print 100 - $1}')
-load_avg=$(uptime | awk -F'load average:' '{print $2}' | awk '{print $1","$2","$3}' | tr -d ' ')
-load_1=$(echo "$load_avg" | cut -d',' -f1)
-load_5=$(echo "$load_avg" | cut -d',' -f2)
-load_15=$(echo "$load_avg" | cut -d',' -f3)
-
-# Memory usage
-mem_info=$(free -g | grep "^Mem:")
-mem_total=$(echo "$mem_info" | awk '{print $2}')
-mem_used=$(echo "$mem_info" | awk '{print $3}')
-mem_avail=$(echo "$mem_info" | awk '{print $7}')
-mem_percent=$(echo "scale=2; ($mem_used / $mem_total) * 100" | bc)
-
-# Network I/O (bytes in/out per interfaccia principale)
-net_dev=$(ip route | grep default | awk '{print $5}' | head -1)
-if [ -n "$net_dev" ] && [ -f "/sys/class/net/$net_dev/statistics/rx_bytes" ]; then
-    net_rx=$(cat /sys/class/net/$net_dev/statistics/rx_bytes)
-    net_tx=$(cat /sys/class/net/$net_dev/statistics/tx_bytes)
-    net_rx_packets=$(cat /sys/class/net/$net_dev/statistics/rx_packets)
-    net_tx_packets=$(cat /sys/class/net/$net_dev/statistics/tx_packets)
-else
-    net_rx=0
-    net_tx=0
-    net_rx_packets=0
-    net_tx_packets=0
-fi
-
-# Disk I/O (somma di tutti i dischi)
-disk_read=0
-disk_write=0
-disk_read_ops=0
-disk_write_ops=0
-for disk in /sys/block/sd* /sys/block/nvme* /sys/block/vd*; do
-    if [ -f "$disk/stat" ]; then
-        read_bytes=$(awk '{print $3}' "$disk/stat" 2>/dev/null || echo "0")
-        write_bytes=$(awk '{print $7}' "$disk/stat" 2>/dev/null || echo "0")
-        read_ops=$(awk '{print $1}' "$disk/stat" 2>/dev/null || echo "0")
-        write_ops=$(awk '{print $5}' "$disk/stat" 2>/dev/null || echo "0")
-        disk_read=$((disk_read + read_bytes * 512))
-        disk_write=$((disk_write + write_bytes * 512))
-        disk_read_ops=$((disk_read_ops + read_ops))
-        disk_write_ops=$((disk_write_ops + write_ops))
-    fi
-done
-
-echo "CPU|$cpu_info|$load_1|$load_5|$load_15"
-echo "MEM|$mem_total|$mem_used|$mem_avail|$mem_percent"
-echo "NET|$net_dev|$net_rx|$net_tx|$net_rx_packets|$net_tx_packets"
-echo "DISK|$disk_read|$disk_write|$disk_read_ops|$disk_write_ops"
-'''
+            cached = self._net_devs.get(hostname)
+            net_dev = cached[1] if cached and time.monotonic() - cached[0] < _NET_DEV_TTL else None
+            result = await self._run_metrics_script(hostname, port, username, key_path, net_dev)
             
-            result = await ssh_service.execute(
-                hostname=hostname,
-                command=metrics_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=30
-            )
+            if not result.success:
+                return None
             
-            if result.success:
-                for line in result.stdout.splitlines():
-                    if line.startswith("CPU|"):
-                        parts = line.split("|")
-                        if len(parts) >= 5:
-                            metrics["cpu"]["usage_percent"] = float(parts[1] or 0)
-                            metrics["cpu"]["load_1min"] = float(parts[2] or 0)
-                            metrics["cpu"]["load_5min"] = float(parts[3] or 0)
-                            metrics["cpu"]["load_15min"] = float(parts[4] or 0)
-                    elif line.startswith("MEM|"):
-                        parts = line.split("|")
-                        if len(parts) >= 5:
-                            metrics["memory"]["total_gb"] = float(parts[1] or 0)
-                            metrics["memory"]["used_gb"] = float(parts[2] or 0)
-                            metrics["memory"]["available_gb"] = float(parts[3] or 0)
-                            metrics["memory"]["usage_percent"] = float(parts[4] or 0)
-                    elif line.startswith("NET|"):
-                        parts = line.split("|")
-                        if len(parts) >= 6:
-                            metrics["network"]["interfaces"] = [{
-                                "name": parts[1] or "unknown",
-                                "rx_bytes": int(parts[2] or 0),
-                                "tx_bytes": int(parts[3] or 0),
-                                "rx_packets": int(parts[4] or 0),
-                                "tx_packets": int(parts[5] or 0)
-                            }]
-                    elif line.startswith("DISK|"):
-                        parts = line.split("|")
-                        if len(parts) >= 5:
-                            metrics["disk"]["io_read_bytes"] = int(parts[1] or 0)
-                            metrics["disk"]["io_write_bytes"] = int(parts[2] or 0)
-                            metrics["disk"]["io_read_ops"] = int(parts[3] or 0)
-                            metrics["disk"]["io_write_ops"] = int(parts[4] or 0)
+            metrics = copy.deepcopy(_METRICS_TEMPLATE)
+            metrics["timestamp"] = timestamp or datetime.now(timezone.utc).isoformat()
+            found = self._parse_metrics(hostname, result.stdout, metrics)
+            # Interfaccia ricalcolata dallo script (nessuna in cache o non più esistente)
+            if found and found != net_dev:
+                self._net_devs[hostname] = (time.monotonic(), found)
             
             return metrics
         except Exception as e:
             logger.error(f"Errore raccolta metriche per {hostname}: {e}")
-            return metrics
+            return None
+    
+    async def _run_metrics_script(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        key_path: str,
+        net_dev: Optional[str] = None
+    ):
+        """
+        Esegue _METRICS_CMD sul nodo. Alla prima raccolta lo script viene anche salvato
+        in _METRICS_SCRIPT_PATH; le successive lo eseguono per path senza reinviarlo,
+        passando l'eventuale interfaccia di default già nota.
+        """
+        host_key = (hostname, port, username)
+        installed = host_key in self._metrics_script_hosts
+        if installed:
+            command = f"sh {_METRICS_SCRIPT_PATH}"
+            if net_dev:
+                command += f" {shlex.quote(net_dev)}"
+        else:
+            command = _METRICS_INSTALL_CMD
+        result = await ssh_service.execute(
+            hostname=hostname,
+            command=command,
+            port=port,
+            username=username,
+            key_path=key_path,
+            timeout=30
+        )
+        
+        if installed and not result.success and result.exit_code != -1:
+            # Script non più presente sul nodo (es. /run svuotata dal riavvio): lo si reinstalla
+            self._metrics_script_hosts.discard(host_key)
+            return await self._run_metrics_script(hostname, port, username, key_path, net_dev)
+        
+        # Per path solo se il salvataggio è confermato: altrimenti ogni raccolta
+        # pagherebbe un tentativo fallito più la reinstallazione
+        if result.success and not installed and _METRICS_SAVED_MARKER in result.stdout:
+            self._metrics_script_hosts.add(host_key)
+        return result
+    
+    def _parse_metrics(self, hostname: str, output: str, metrics: Dict[str, Any]) -> str:
+        """
+        Parsa le sezioni /proc e /sys prodotte da _METRICS_CMD e popola metrics.
+        Restituisce l'interfaccia di default usata dallo script ("" se assente).
+        """
+        sections: Dict[str, List[str]] = {}
+        disks: List[str] = []
+        net_dev = ""
+        current: Optional[List[str]] = None
+        
+        for line in output.splitlines():
+            if line.startswith("==> "):
+                # Intestazione di head -v per ogni /sys/block/*/stat
+                current = None
+                disks.append("")
+            elif line.startswith("=="):
+                name, _, arg = line[2:].partition(" ")
+                if name == "NET":
+                    net_dev = arg.strip()
+                current = sections.setdefault(name, [])
+            elif current is not None:
+                current.append(line)
+            elif disks and not disks[-1]:
+                disks[-1] = line
+        
+        # CPU: utilizzo calcolato sulla differenza rispetto al campione precedente
+        for line in sections.get("STAT", []):
+            if line.startswith("cpu "):
+                fields = [int(v) for v in line.split()[1:9]]
+                total = sum(fields)
+                idle = fields[3] + fields[4]
+                prev = self._prev_cpu.get(hostname)
+                self._prev_cpu[hostname] = (total, idle)
+                if prev and total > prev[0]:
+                    total, idle = total - prev[0], idle - prev[1]
+                if total > 0:
+                    metrics["cpu"]["usage_percent"] = round((total - idle) / total * 100, 2)
+                break
+        
+        loads = " ".join(sections.get("LOADAVG", [])).split()
+        if len(loads) >= 3:
+            metrics["cpu"]["load_1min"] = float(loads[0])
+            metrics["cpu"]["load_5min"] = float(loads[1])
+            metrics["cpu"]["load_15min"] = float(loads[2])
+        
+        # Memoria: MemAvailable tiene conto di buffers/cache
+        mem_kib = {}
+        for line in sections.get("MEMINFO", []):
+            key, _, value = line.partition(":")
+            if key in _METRICS_MEMINFO_KEYS:
+                mem_kib[key] = int(value.split()[0])
+        total_kib = mem_kib.get("MemTotal", 0)
+        if total_kib:
+            available_kib = mem_kib.get("MemAvailable")
+            if available_kib is None:
+                # Kernel senza MemAvailable (< 3.14): stima con memoria libera + buffers + cache
+                available_kib = sum(mem_kib.get(k, 0) for k in ("MemFree", "Buffers", "Cached"))
+            metrics["memory"]["total_gb"] = round(total_kib / _KIB_TO_GB, 2)
+            metrics["memory"]["available_gb"] = round(available_kib / _KIB_TO_GB, 2)
+            metrics["memory"]["used_gb"] = round((total_kib - available_kib) / _KIB_TO_GB, 2)
+            metrics["memory"]["usage_percent"] = round((total_kib - available_kib) / total_kib * 100, 2)
+        
+        # Network: rx_bytes, tx_bytes, rx_packets, tx_packets dell'interfaccia di default
+        net_values = [int(v) for v in sections.get("NET", []) if v.strip().isdigit()]
+        if len(net_values) < 4:
+            net_values = [0, 0, 0, 0]
+        metrics["network"]["interfaces"] = [{
+            "name": net_dev or "unknown",
+            "rx_bytes": net_values[0],
+            "tx_bytes": net_values[1],
+            "rx_packets": net_values[2],
+            "tx_packets": net_values[3]
+        }]
+        
+        # Disk I/O: somma di tutti i dischi (campi di /sys/block/*/stat, settori da 512 byte)
+        for line in disks:
+            fields = line.split()
+            if len(fields) >= 7:
+                metrics["disk"]["io_read_ops"] += int(fields[0])
+                metrics["disk"]["io_read_bytes"] += int(fields[2]) * 512
+                metrics["disk"]["io_write_ops"] += int(fields[4])
+                metrics["disk"]["io_write_bytes"] += int(fields[6]) * 512
+        
+        return net_dev
 
 
 # Singleton
 host_info_service = HostInfoService()
-
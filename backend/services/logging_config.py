@@ -1,6 +1,11 @@
 """
 DAPX-backandrepl - Configurazione Logging Avanzato
 Sistema di logging strutturato con dettagli estesi
+
+Nei messaggi di log usare la formattazione lazy con %:
+    logger.info("Job %s completato in %.1fs", job_id, duration)
+e non le f-string: gli argomenti vengono formattati solo se il record viene
+effettivamente emesso (con ruff si può imporre abilitando le regole "G").
 """
 
 import logging
@@ -8,12 +13,21 @@ import logging.handlers
 import os
 import sys
 import json
+import queue
+import atexit
+import threading
+import time
+import functools
 from datetime import datetime
 from typing import Optional, Dict, Any
-import traceback
-import threading
 import asyncio
 
+try:
+    # orjson (opzionale) serializza i log JSON molto più velocemente di json
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # ============== CONFIGURAZIONE ==============
 
@@ -32,9 +46,102 @@ LOG_BACKUP_COUNT = int(os.environ.get("DAPX_LOG_BACKUP_COUNT", 5))
 # Log verboso (include stack trace per ogni log)
 LOG_VERBOSE = os.environ.get("DAPX_LOG_VERBOSE", "false").lower() == "true"
 
+# Record accumulati per file prima di scriverli in blocco, e secondi massimi
+# di attesa prima che un record bufferizzato finisca su disco
+LOG_BUFFER_CAPACITY = 512
+LOG_FLUSH_INTERVAL = 1.0
+
+# Listener che scrive i log su file da un thread dedicato (avviato da setup_logging)
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+# Segnale di arresto del thread che svuota periodicamente i buffer dei file
+_flush_stop: Optional[threading.Event] = None
+
 
 # ============== FORMATTATORI PERSONALIZZATI ==============
 
+def _json_dumps(data: Dict[str, Any]) -> str:
+    """Serializza un record JSON con orjson se disponibile, altrimenti con json"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=str, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # Valori che orjson non gestisce (es. interi oltre 64 bit): ripiega su json
+            pass
+    return json.dumps(data, default=str)
+
+
+def _json_dumps_line(data: Dict[str, Any]) -> bytes:
+    """Come _json_dumps, ma restituisce la riga NDJSON già codificata (con newline)"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                data, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+            )
+        except TypeError:
+            pass
+    return json.dumps(data, default=str).encode("utf-8") + b"\n"
+
+
+class _SecondsCache:
+    """
+    Parte data/ora (fino ai secondi) dei timestamp: strftime viene rieseguito solo
+    al cambio di secondo. La cache è una tupla unica, così l'aggiornamento è
+    atomico anche con più thread che formattano.
+    """
+    
+    def __init__(self, fmt: str):
+        self._fmt = fmt
+        self._cache = (None, "")
+    
+    def __call__(self, created: float) -> str:
+        sec = int(created)
+        cached_sec, text = self._cache
+        if sec != cached_sec:
+            text = time.strftime(self._fmt, time.localtime(sec))
+            self._cache = (sec, text)
+        return text
+
+
+def _current_task_name() -> Optional[str]:
+    """Nome del task asyncio in esecuzione nel thread corrente (None fuori da un event loop)"""
+    # _get_running_loop restituisce None senza sollevare: niente RuntimeError da
+    # costruire e catturare per ogni record loggato fuori dall'event loop
+    loop = asyncio._get_running_loop()
+    if loop is None:
+        return None
+    task = asyncio.current_task(loop)
+    return task.get_name() if task else None
+
+
+def _record_task_name(record: logging.LogRecord) -> Optional[str]:
+    """
+    Nome del task asyncio che ha emesso il record: quello annotato da
+    AsyncContextFilter, altrimenti quello corrente (formattatore usato da solo).
+    """
+    if hasattr(record, "taskName"):
+        return record.taskName
+    return _current_task_name()
+
+
+@functools.lru_cache(maxsize=256)
+def _pad_module(name: str) -> str:
+    """Nome del logger troncato e con padding a 30 caratteri (i nomi distinti sono pochi)"""
+    if len(name) > 30:
+        name = '...' + name[-27:]
+    return name.ljust(30)
+
+
+@functools.lru_cache(maxsize=1024)
+def _pad_funcinfo(func_name: str, lineno: int) -> str:
+    """'funzione:linea' con padding a 25 caratteri (i punti di log caldi si ripetono)"""
+    return f"{func_name}:{lineno}".ljust(25)
+
+
+def _no_thread_info(record: logging.LogRecord) -> str:
+    """Thread/Task info per i formattatori con include_thread=False"""
+    return ""
+
+
 class DetailedFormatter(logging.Formatter):
     """
     Formattatore con dettagli estesi:
@@ -56,88 +163,91 @@ class DetailedFormatter(logging.Formatter):
         'DIM': '\033[2m',         # Dim
     }
     
-    def __init__(self, use_colors: bool = True, include_thread: bool = True):
-        self.use_colors = use_colors and sys.stdout.isatty()
+    def __init__(self, use_colors: bool = True, include_thread: bool = True, include_async: bool = True):
+        # Colori solo su terminale, e mai con NO_COLOR impostata (https://no-color.org)
+        self.use_colors = use_colors and sys.stdout.isatty() and not os.environ.get("NO_COLOR")
         self.include_thread = include_thread
+        self.include_async = include_async
+        self._seconds = _SecondsCache('%Y-%m-%d %H:%M:%S')
         super().__init__()
+        
+        # Livelli già con padding (e colore), e template della riga: calcolati una volta sola
+        if self.use_colors:
+            reset = self.COLORS['RESET']
+            dim = self.COLORS['DIM']
+            self._levels = {
+                name: f"{self.COLORS[name]}{name.ljust(8)}{reset}"
+                for name in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+            }
+            self._template = f"{dim}{{}}{reset} {{}} {dim}{{}}{reset} {dim}{{}}{reset} {{}}{{}}"
+        else:
+            self._levels = {
+                name: name.ljust(8)
+                for name in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+            }
+            self._template = "{} {} {} {} {}{}"
+        
+        # Parte thread/task scelta una volta: senza include_thread non c'è nulla da calcolare
+        self._thread_info = self._format_thread_info if include_thread else _no_thread_info
+        
+        # Formattatori con la stessa configurazione producono la stessa riga
+        self._cache_key = (self.use_colors, self.include_thread, self.include_async)
     
     def format(self, record: logging.LogRecord) -> str:
+        # Record già formattato da un altro handler (es. file principale ed errori)
+        cached = record.__dict__.get("_dapx_formatted")
+        if cached is not None and cached[0] == self._cache_key:
+            return cached[1]
+        
         # Timestamp preciso con millisecondi
-        timestamp = datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        timestamp = f"{self._seconds(record.created)}.{int(record.msecs):03d}"
         
-        # Livello con padding
-        level = record.levelname.ljust(8)
+        # Livello con padding (livelli personalizzati: solo padding)
+        level = self._levels.get(record.levelname) or record.levelname.ljust(8)
         
         # Modulo e funzione
-        module = record.name
-        if len(module) > 30:
-            module = '...' + module[-27:]
-        module = module.ljust(30)
+        module = _pad_module(record.name)
         
         # Funzione e linea
-        func_info = f"{record.funcName}:{record.lineno}"
-        func_info = func_info.ljust(25)
-        
-        # Thread/Task info
-        thread_info = ""
-        if self.include_thread:
-            thread_name = threading.current_thread().name
-            if thread_name == "MainThread":
-                thread_name = "Main"
-            elif thread_name.startswith("Thread-"):
-                thread_name = f"T{thread_name[7:]}"
-            
-            # Prova a ottenere il nome del task asyncio
-            try:
-                task = asyncio.current_task()
-                if task:
-                    task_name = task.get_name()
-                    if task_name.startswith("Task-"):
-                        task_name = f"A{task_name[5:]}"
-                    thread_info = f"[{thread_name}/{task_name}]"
-                else:
-                    thread_info = f"[{thread_name}]"
-            except RuntimeError:
-                thread_info = f"[{thread_name}]"
-            
-            thread_info = thread_info.ljust(15)
+        func_info = _pad_funcinfo(record.funcName, record.lineno)
         
         # Messaggio
         message = record.getMessage()
         
         # Costruisci la linea di log
-        if self.use_colors:
-            color = self.COLORS.get(record.levelname, '')
-            reset = self.COLORS['RESET']
-            dim = self.COLORS['DIM']
-            
-            log_line = (
-                f"{dim}{timestamp}{reset} "
-                f"{color}{level}{reset} "
-                f"{dim}{module}{reset} "
-                f"{dim}{func_info}{reset} "
-                f"{thread_info}"
-                f"{message}"
-            )
-        else:
-            log_line = (
-                f"{timestamp} "
-                f"{level} "
-                f"{module} "
-                f"{func_info} "
-                f"{thread_info}"
-                f"{message}"
-            )
+        log_line = self._template.format(timestamp, level, module, func_info, self._thread_info(record), message)
         
-        # Aggiungi exception info se presente
+        # Aggiungi exception info se presente (testo in cache sul record, come in logging.Formatter)
         if record.exc_info:
-            log_line += "\n" + self.formatException(record.exc_info)
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            log_line += "\n" + record.exc_text
         
         # Aggiungi stack info se presente
         if record.stack_info:
             log_line += "\n" + record.stack_info
         
+        record._dapx_formatted = (self._cache_key, log_line)
         return log_line
+    
+    def _format_thread_info(self, record: logging.LogRecord) -> str:
+        """Thread/Task info con padding"""
+        # Thread del chiamante (il formattatore può girare nel thread del listener)
+        thread_name = record.threadName
+        if thread_name == "MainThread":
+            thread_name = "Main"
+        elif thread_name.startswith("Thread-"):
+            thread_name = f"T{thread_name[7:]}"
+        
+        task_name = _record_task_name(record) if self.include_async else None
+        if task_name:
+            if task_name.startswith("Task-"):
+                task_name = f"A{task_name[5:]}"
+            thread_info = f"[{thread_name}/{task_name}]"
+        else:
+            thread_info = f"[{thread_name}]"
+        
+        return thread_info.ljust(15)
 
 
 class JSONFormatter(logging.Formatter):
@@ -145,38 +255,234 @@ class JSONFormatter(logging.Formatter):
     Formattatore JSON per log strutturati (utile per sistemi di log aggregation)
     """
     
+    def __init__(self, include_async: bool = True):
+        self.include_async = include_async
+        self._seconds = _SecondsCache('%Y-%m-%dT%H:%M:%S')
+        super().__init__()
+    
     def format(self, record: logging.LogRecord) -> str:
+        return _json_dumps(self._log_data(record))
+    
+    def format_bytes(self, record: logging.LogRecord) -> bytes:
+        """Riga JSON già codificata e terminata da newline, per FastRotatingFileHandler"""
+        return _json_dumps_line(self._log_data(record))
+    
+    def _log_data(self, record: logging.LogRecord) -> Dict[str, Any]:
+        created = record.created
         log_data = {
-            "timestamp": datetime.fromtimestamp(record.created).isoformat(),
+            "timestamp": f"{self._seconds(created)}.{int((created - int(created)) * 1e6):06d}",
             "level": record.levelname,
             "module": record.name,
             "function": record.funcName,
             "line": record.lineno,
-            "thread": threading.current_thread().name,
+            "thread": record.threadName,
             "message": record.getMessage(),
         }
         
         # Aggiungi task asyncio se disponibile
-        try:
-            task = asyncio.current_task()
-            if task:
-                log_data["async_task"] = task.get_name()
-        except RuntimeError:
-            pass
+        if self.include_async:
+            task_name = _record_task_name(record)
+            if task_name:
+                log_data["async_task"] = task_name
         
         # Aggiungi extra data se presente
         if hasattr(record, 'extra_data'):
             log_data["extra"] = record.extra_data
         
-        # Aggiungi exception info
+        # Aggiungi exception info (traceback formattato una volta e condiviso tra gli handler)
         if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
             log_data["exception"] = {
                 "type": record.exc_info[0].__name__ if record.exc_info[0] else None,
                 "message": str(record.exc_info[1]) if record.exc_info[1] else None,
-                "traceback": traceback.format_exception(*record.exc_info)
+                "traceback": record.exc_text.splitlines(keepends=True)
             }
         
-        return json.dumps(log_data, default=str)
+        return log_data
+
+
+class AsyncContextFilter(logging.Filter):
+    """
+    Annota sul record il task asyncio che lo emette (record.taskName, come in
+    Python 3.12). Gira nel thread chiamante e solo per i record che superano il
+    livello dell'handler; se il record passa da più handler la ricerca del task
+    avviene una volta sola, e i formattatori nel thread del listener leggono
+    l'attributo invece del task corrente.
+    """
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "taskName"):
+            record.taskName = _current_task_name()
+        return True
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler per la coda in-process del listener: il record non viene
+    pre-formattato (i formattatori dei file mantengono exc_info), ma il messaggio
+    viene risolto subito.
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+class FastRotatingFileHandler(logging.Handler):
+    """
+    File di log in append con la stessa rotazione di RotatingFileHandler
+    (file.1 ... file.N), ma scritto con os.write su un descrittore O_APPEND:
+    niente stream bufferizzato da svuotare né seek per ogni record. La
+    dimensione è tenuta in memoria e riletta dal filesystem solo quando sembra
+    superare maxBytes o ogni SIZE_RESYNC_WRITES scritture (altri processi o
+    logrotate possono modificare il file).
+    """
+    
+    SIZE_RESYNC_WRITES = 256
+    terminator = "\n"
+    
+    def __init__(self, filename: str, maxBytes: int = 0, backupCount: int = 0, encoding: str = 'utf-8'):
+        super().__init__()
+        self.baseFilename = os.path.abspath(filename)
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.encoding = encoding
+        self._fd = None
+        self._size = 0
+        self._writes = 0
+        self._open()
+    
+    def _open(self):
+        self._fd = os.open(self.baseFilename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._size = os.fstat(self._fd).st_size
+        self._writes = 0
+    
+    def encode(self, record: logging.LogRecord) -> bytes:
+        """
+        Record formattato e codificato, terminatore incluso. Se il formattatore
+        produce direttamente bytes (JSONFormatter.format_bytes) non c'è nessuna
+        ricodifica.
+        """
+        format_bytes = getattr(self.formatter, "format_bytes", None)
+        if format_bytes is not None:
+            return format_bytes(record)
+        return (self.format(record) + self.terminator).encode(self.encoding, errors='backslashreplace')
+    
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.write(self.encode(record))
+        except Exception:
+            self.handleError(record)
+    
+    def write(self, data: bytes):
+        """Scrive uno o più record già codificati, ruotando il file se necessario"""
+        if self._fd is None:
+            self._open()
+        if self.maxBytes > 0 and self.backupCount > 0:
+            self._writes += 1
+            if self._size + len(data) >= self.maxBytes or self._writes >= self.SIZE_RESYNC_WRITES:
+                self._size = os.fstat(self._fd).st_size
+                self._writes = 0
+                if self._size and self._size + len(data) >= self.maxBytes:
+                    self.doRollover()
+        view = memoryview(data)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        self._size += len(data)
+    
+    def doRollover(self):
+        os.close(self._fd)
+        self._fd = None
+        for i in range(self.backupCount - 1, 0, -1):
+            source = f"{self.baseFilename}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.baseFilename}.{i + 1}")
+        os.replace(self.baseFilename, f"{self.baseFilename}.1")
+        self._open()
+    
+    def close(self):
+        self.acquire()
+        try:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        finally:
+            self.release()
+            super().close()
+
+
+class _BufferedFileHandler(logging.handlers.MemoryHandler):
+    """
+    Buffer davanti a un FastRotatingFileHandler: i record accumulati vengono
+    scritti con una sola write e un solo controllo di rotazione per blocco.
+    Un ERROR svuota subito il buffer.
+    """
+    
+    def __init__(self, target: FastRotatingFileHandler):
+        super().__init__(
+            LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=target, flushOnClose=True
+        )
+        self.setLevel(target.level)
+    
+    def flush(self):
+        self.acquire()
+        try:
+            if self.target is not None and self.buffer:
+                self._write_batch(self.target, self.buffer)
+                self.buffer.clear()
+        finally:
+            self.release()
+    
+    def _write_batch(self, target: FastRotatingFileHandler, records: list):
+        lines = []
+        for record in records:
+            try:
+                lines.append(target.encode(record))
+            except Exception:
+                target.handleError(record)
+        
+        target.acquire()
+        try:
+            target.write(b"".join(lines))
+        except Exception:
+            target.handleError(records[-1])
+        finally:
+            target.release()
+    
+    def close(self):
+        target = self.target
+        try:
+            super().close()
+        finally:
+            if target is not None:
+                target.close()
+
+
+def _flush_periodically(handlers: list, stop: threading.Event):
+    """Svuota i buffer dei file ogni LOG_FLUSH_INTERVAL secondi, per limitare i log persi in un crash"""
+    while not stop.wait(LOG_FLUSH_INTERVAL):
+        for handler in handlers:
+            handler.flush()
+
+
+def _stop_queue_listener():
+    """Ferma il listener dei file di log, scrivendo i record ancora in coda o nei buffer"""
+    global _queue_listener, _flush_stop
+    if _flush_stop is not None:
+        _flush_stop.set()
+        _flush_stop = None
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        for handler in _queue_listener.handlers:
+            handler.close()
+        _queue_listener = None
+
+
+atexit.register(_stop_queue_listener)
 
 
 # ============== CONTEXT LOGGER ==============
@@ -185,11 +491,19 @@ class ContextLogger:
     """
     Logger con supporto per contesto di operazione.
     Permette di aggiungere contesto che viene incluso in ogni log.
+    Il prefisso del contesto viene calcolato una volta alla creazione.
     """
     
+    __slots__ = ('_logger', '_context', '_prefix')
+    
     def __init__(self, logger: logging.Logger, context: Optional[Dict[str, Any]] = None):
         self._logger = logger
         self._context = context or {}
+        if self._context:
+            ctx_str = " | ".join(f"{k}={v}" for k, v in self._context.items())
+            self._prefix = f"[{ctx_str}] "
+        else:
+            self._prefix = ""
     
     def with_context(self, **kwargs) -> 'ContextLogger':
         """Crea un nuovo logger con contesto aggiuntivo"""
@@ -198,9 +512,8 @@ class ContextLogger:
     
     def _format_message(self, message: str) -> str:
         """Aggiunge il contesto al messaggio"""
-        if self._context:
-            ctx_str = " | ".join(f"{k}={v}" for k, v in self._context.items())
-            return f"[{ctx_str}] {message}"
+        if self._prefix:
+            return f"{self._prefix}{message}"
         return message
     
     def debug(self, message: str, *args, **kwargs):
@@ -224,6 +537,10 @@ class ContextLogger:
 
 # ============== OPERATION LOGGER ==============
 
+# Separatore delle righe di inizio/fine operazione
+_DIVIDER = '=' * 20
+
+
 class OperationLogger:
     """
     Logger per operazioni lunghe con tracciamento fasi.
@@ -235,52 +552,59 @@ class OperationLogger:
             op.info("Trasferimento...")
     """
     
+    __slots__ = (
+        'operation_name', 'context', 'current_phase', 'start_time', '_start_ns',
+        '_phase_start_ns', '_logger', 'phases_completed', '_upper_name', '_prefix'
+    )
+    
     def __init__(self, operation_name: str, logger: Optional[logging.Logger] = None, **context):
         self.operation_name = operation_name
         self.context = context
         self.current_phase = "init"
+        # Ora di inizio leggibile; le durate usano il clock monotono (in ns)
         self.start_time = None
-        self.phase_start_time = None
+        self._start_ns = None
+        self._phase_start_ns = None
         self._logger = logger or logging.getLogger(f"operations.{operation_name}")
         self.phases_completed = []
+        self._upper_name = operation_name.upper()
+        # Prefisso dei messaggi, aggiornato solo al cambio di fase
+        self._prefix = f"[{self._upper_name}]"
     
     def __enter__(self):
         self.start_time = datetime.now()
-        self.phase_start_time = self.start_time
-        self._log("INFO", f"{'='*20} INIZIO OPERAZIONE: {self.operation_name.upper()} {'='*20}")
+        self._start_ns = time.monotonic_ns()
+        self._phase_start_ns = self._start_ns
+        self._log("INFO", f"{_DIVIDER} INIZIO OPERAZIONE: {self._upper_name} {_DIVIDER}")
         if self.context:
             ctx_str = ", ".join(f"{k}={v}" for k, v in self.context.items())
             self._log("INFO", f"Contesto: {ctx_str}")
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        duration = (datetime.now() - self.start_time).total_seconds()
+        duration = (time.monotonic_ns() - self._start_ns) / 1e9
         if exc_type:
             self._log("ERROR", f"OPERAZIONE FALLITA: {exc_type.__name__}: {exc_val}")
-            self._log("ERROR", f"{'='*20} FINE OPERAZIONE: {self.operation_name.upper()} (ERRORE, {duration:.2f}s) {'='*20}")
+            self._log("ERROR", f"{_DIVIDER} FINE OPERAZIONE: {self._upper_name} (ERRORE, {duration:.2f}s) {_DIVIDER}")
         else:
-            self._log("INFO", f"{'='*20} FINE OPERAZIONE: {self.operation_name.upper()} (OK, {duration:.2f}s) {'='*20}")
+            self._log("INFO", f"{_DIVIDER} FINE OPERAZIONE: {self._upper_name} (OK, {duration:.2f}s) {_DIVIDER}")
         return False  # Non sopprimere eccezioni
     
     def phase(self, phase_name: str):
         """Inizia una nuova fase dell'operazione"""
-        if self.phase_start_time and self.current_phase != "init":
-            phase_duration = (datetime.now() - self.phase_start_time).total_seconds()
+        if self._phase_start_ns is not None and self.current_phase != "init":
+            phase_duration = (time.monotonic_ns() - self._phase_start_ns) / 1e9
             self.phases_completed.append((self.current_phase, phase_duration))
             self._log("INFO", f"Fase '{self.current_phase}' completata in {phase_duration:.2f}s")
         
         self.current_phase = phase_name
-        self.phase_start_time = datetime.now()
+        self._prefix = f"[{self._upper_name}][{phase_name}]"
+        self._phase_start_ns = time.monotonic_ns()
         self._log("INFO", f">>> FASE: {phase_name.upper()}")
     
     def _log(self, level: str, message: str):
         """Log interno con prefisso operazione"""
-        prefix = f"[{self.operation_name.upper()}]"
-        if self.current_phase and self.current_phase != "init":
-            prefix += f"[{self.current_phase}]"
-        
-        full_message = f"{prefix} {message}"
-        getattr(self._logger, level.lower())(full_message)
+        getattr(self._logger, level.lower())(f"{self._prefix} {message}")
     
     def debug(self, message: str):
         self._log("DEBUG", message)
@@ -322,71 +646,112 @@ def setup_logging(
         json_output: Usa formato JSON invece di testo
         verbose: Abilita logging verboso (include più dettagli)
     """
-    level = level or LOG_LEVEL
+    global _queue_listener, _flush_stop
+    
+    level = (level or LOG_LEVEL).upper()
+    # Solo nomi di livello validi (getattr accettava qualsiasi attributo del modulo logging):
+    # getLevelName restituisce l'int per i nomi registrati, una stringa per gli altri.
+    # Non getLevelNamesMapping, che esiste solo da Python 3.11 (install.sh accetta 3.9)
+    numeric_level = logging.getLevelName(level)
+    if not isinstance(numeric_level, int):
+        numeric_level = logging.INFO
     log_dir = log_dir or LOG_DIR
     verbose = verbose if verbose is not None else LOG_VERBOSE
     
+    # PID e nome del processo non compaiono nei formattatori: evita di calcolarli per ogni record
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    
     # Crea directory log se necessario
     if file_output and log_dir:
         os.makedirs(log_dir, exist_ok=True)
     
     # Configura root logger
     root_logger = logging.getLogger()
-    root_logger.setLevel(getattr(logging, level, logging.INFO))
+    root_logger.setLevel(numeric_level)
     
     # Rimuovi handler esistenti
     root_logger.handlers.clear()
+    _stop_queue_listener()
+    
+    # Task asyncio annotato sul record una volta sola, condiviso da tutti gli handler
+    async_context = AsyncContextFilter()
     
     # Handler console
     if console_output:
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(getattr(logging, level, logging.INFO))
+        console_handler.setLevel(numeric_level)
         
         if json_output:
             console_handler.setFormatter(JSONFormatter())
         else:
             console_handler.setFormatter(DetailedFormatter(use_colors=True, include_thread=True))
         
+        console_handler.addFilter(async_context)
         root_logger.addHandler(console_handler)
     
-    # Handler file (rotazione automatica)
+    # Handler file (rotazione automatica): scritti dal thread del listener, così
+    # l'I/O su disco e la rotazione non bloccano il chiamante (né l'event loop)
+    file_handlers = []
     if file_output and log_dir:
         # File principale
         main_log_file = os.path.join(log_dir, "dapx.log")
-        file_handler = logging.handlers.RotatingFileHandler(
+        file_handler = FastRotatingFileHandler(
             main_log_file,
             maxBytes=LOG_MAX_BYTES,
             backupCount=LOG_BACKUP_COUNT,
             encoding='utf-8'
         )
-        file_handler.setLevel(getattr(logging, level, logging.INFO))
-        file_handler.setFormatter(DetailedFormatter(use_colors=False, include_thread=True))
-        root_logger.addHandler(file_handler)
+        file_handler.setLevel(numeric_level)
+        # Stesso formattatore per file principale ed errori
+        file_formatter = DetailedFormatter(use_colors=False, include_thread=True)
+        file_handler.setFormatter(file_formatter)
+        file_handlers.append(file_handler)
         
         # File errori separato
         error_log_file = os.path.join(log_dir, "dapx-errors.log")
-        error_handler = logging.handlers.RotatingFileHandler(
+        error_handler = FastRotatingFileHandler(
             error_log_file,
             maxBytes=LOG_MAX_BYTES,
             backupCount=LOG_BACKUP_COUNT,
             encoding='utf-8'
         )
         error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(DetailedFormatter(use_colors=False, include_thread=True))
-        root_logger.addHandler(error_handler)
+        error_handler.setFormatter(file_formatter)
+        file_handlers.append(error_handler)
         
         # File JSON per analisi (opzionale)
         if json_output:
             json_log_file = os.path.join(log_dir, "dapx.json.log")
-            json_handler = logging.handlers.RotatingFileHandler(
+            json_handler = FastRotatingFileHandler(
                 json_log_file,
                 maxBytes=LOG_MAX_BYTES,
                 backupCount=LOG_BACKUP_COUNT,
                 encoding='utf-8'
             )
-            json_handler.setLevel(getattr(logging, level, logging.INFO))
+            json_handler.setLevel(numeric_level)
             json_handler.setFormatter(JSONFormatter())
-            root_logger.addHandler(json_handler)
+            file_handlers.append(json_handler)
+    
+    if file_handlers:
+        buffered_handlers = [_BufferedFileHandler(handler) for handler in file_handlers]
+        log_queue = queue.SimpleQueue()
+        queue_handler = _LocalQueueHandler(log_queue)
+        # I record sotto il livello di tutti i file non vengono nemmeno accodati
+        # (es. DEBUG di un logger figlio impostato più in basso del root)
+        queue_handler.setLevel(min(handler.level for handler in file_handlers))
+        queue_handler.addFilter(async_context)
+        root_logger.addHandler(queue_handler)
+        _queue_listener = logging.handlers.QueueListener(
+            log_queue, *buffered_handlers, respect_handler_level=True
+        )
+        _queue_listener.start()
+        
+        _flush_stop = threading.Event()
+        threading.Thread(
+            target=_flush_periodically, args=(buffered_handlers, _flush_stop),
+            name="dapx-log-flush", daemon=True
+        ).start()
     
     # Configura livelli per moduli specifici
     # Riduci verbosità di alcuni moduli esterni
@@ -398,11 +763,11 @@ def setup_logging(
     
     # Log iniziale
     logger = logging.getLogger(__name__)
-    logger.info(f"Sistema di logging inizializzato")
-    logger.info(f"Livello: {level}")
+    logger.info("Sistema di logging inizializzato")
+    logger.info("Livello: %s", level)
     if file_output and log_dir:
-        logger.info(f"Directory log: {log_dir}")
-    logger.info(f"Console: {console_output}, File: {file_output}, JSON: {json_output}")
+        logger.info("Directory log: %s", log_dir)
+    logger.info("Console: %s, File: %s, JSON: %s", console_output, file_output, json_output)
 
 
 def get_logger(name: str) -> logging.Logger:
@@ -438,9 +803,22 @@ def get_operation_logger(operation: str, **context) -> OperationLogger:
 
 # ============== DECORATORE PER LOGGING AUTOMATICO ==============
 
+def _format_call(func_name: str, args: tuple, kwargs: dict) -> str:
+    """Rappresentazione abbreviata di una chiamata (primi 3 argomenti posizionali e keyword)"""
+    args_str = ", ".join([repr(a)[:50] for a in args[:3]])
+    if len(args) > 3:
+        args_str += ", ..."
+    kwargs_str = ", ".join([f"{k}={repr(v)[:30]}" for k, v in list(kwargs.items())[:3]])
+    if len(kwargs) > 3:
+        kwargs_str += ", ..."
+    return f"{func_name}({args_str}{', ' + kwargs_str if kwargs_str else ''})"
+
+
 def log_function_call(logger: logging.Logger = None):
     """
     Decoratore per loggare automaticamente chiamate a funzioni.
+    Con DEBUG disattivato non costruisce la rappresentazione degli argomenti:
+    misura solo la durata, loggata in caso di errore.
     
     Esempio:
         @log_function_call()
@@ -455,41 +833,37 @@ def log_function_call(logger: logging.Logger = None):
         if asyncio.iscoroutinefunction(func):
             async def async_wrapper(*args, **kwargs):
                 func_name = func.__name__
-                args_str = ", ".join([repr(a)[:50] for a in args[:3]])
-                if len(args) > 3:
-                    args_str += ", ..."
-                kwargs_str = ", ".join([f"{k}={repr(v)[:30]}" for k, v in list(kwargs.items())[:3]])
-                if len(kwargs) > 3:
-                    kwargs_str += ", ..."
-                
-                logger.debug(f">>> {func_name}({args_str}{', ' + kwargs_str if kwargs_str else ''})")
-                start = datetime.now()
+                debug = logger.isEnabledFor(logging.DEBUG)
+                if debug:
+                    logger.debug(">>> %s", _format_call(func_name, args, kwargs))
+                start = time.monotonic_ns()
                 try:
                     result = await func(*args, **kwargs)
-                    duration = (datetime.now() - start).total_seconds()
-                    logger.debug(f"<<< {func_name} completato in {duration:.3f}s")
+                    if debug:
+                        duration = (time.monotonic_ns() - start) / 1e9
+                        logger.debug("<<< %s completato in %.3fs", func_name, duration)
                     return result
                 except Exception as e:
-                    duration = (datetime.now() - start).total_seconds()
-                    logger.error(f"<<< {func_name} FALLITO dopo {duration:.3f}s: {type(e).__name__}: {e}")
+                    duration = (time.monotonic_ns() - start) / 1e9
+                    logger.error("<<< %s FALLITO dopo %.3fs: %s: %s", func_name, duration, type(e).__name__, e)
                     raise
             return async_wrapper
         else:
             def sync_wrapper(*args, **kwargs):
                 func_name = func.__name__
-                args_str = ", ".join([repr(a)[:50] for a in args[:3]])
-                kwargs_str = ", ".join([f"{k}={repr(v)[:30]}" for k, v in list(kwargs.items())[:3]])
-                
-                logger.debug(f">>> {func_name}({args_str}{', ' + kwargs_str if kwargs_str else ''})")
-                start = datetime.now()
+                debug = logger.isEnabledFor(logging.DEBUG)
+                if debug:
+                    logger.debug(">>> %s", _format_call(func_name, args, kwargs))
+                start = time.monotonic_ns()
                 try:
                     result = func(*args, **kwargs)
-                    duration = (datetime.now() - start).total_seconds()
-                    logger.debug(f"<<< {func_name} completato in {duration:.3f}s")
+                    if debug:
+                        duration = (time.monotonic_ns() - start) / 1e9
+                        logger.debug("<<< %s completato in %.3fs", func_name, duration)
                     return result
                 except Exception as e:
-                    duration = (datetime.now() - start).total_seconds()
-                    logger.error(f"<<< {func_name} FALLITO dopo {duration:.3f}s: {type(e).__name__}: {e}")
+                    duration = (time.monotonic_ns() - start) / 1e9
+                    logger.error("<<< %s FALLITO dopo %.3fs: %s: %s", func_name, duration, type(e).__name__, e)
                     raise
             return sync_wrapper
     return decorator
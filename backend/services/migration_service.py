@@ -4,10 +4,12 @@ Usa funzionalità native di Proxmox (qm copy / pct copy)
 """
 
 import asyncio
+import os
 from typing import Optional, Dict, Tuple, List
 import logging
 import re
 import json
+import shlex
 import time
 from datetime import datetime
 
@@ -16,6 +18,68 @@ from services.logging_config import get_logger, get_operation_logger, OperationL
 
 logger = get_logger(__name__)
 
+# Stampato dal comando remoto di preparazione quando la verifica della VM è passata
+_CHECK_OK_MARKER = "__DAPX_CHECK_OK__"
+# Stampato dopo ogni delsnapshot del pruning, seguito da nome snapshot ed exit code
+_SNAPSHOT_DELETED_MARKER = "__DAPX_SNAPSHOT_DELETED__"
+
+# Dimensione trasferita nelle righe di avanzamento (es. "transferred 10.5 GiB")
+_TRANSFERRED_RE = re.compile(r'transferred\s+(\d+\.?\d*)\s*(GiB|MiB|KiB|GB|MB|KB)', re.IGNORECASE)
+
+# Chiavi di hw_config gestite da _apply_hw_config: senza nessuna di queste non c'è nulla da applicare
+_HW_CONFIG_KEYS = frozenset({"memory", "cores", "sockets", "cpu", "network", "storage"})
+
+# Spostamenti disco contemporanei sulla stessa VM. Default 1: qm disk move tiene il lock
+# della config per tutta la copia e un secondo spostamento andrebbe in timeout sul lock
+MIGRATION_MAX_PARALLEL_MOVES = int(os.environ.get("DAPX_MIGRATION_MAX_PARALLEL_MOVES", 1))
+
+
+def _transferred_size(line: str) -> Optional[str]:
+    """
+    Dimensione trasferita da una riga di avanzamento ("transferred 10.5 GiB"), None se la
+    riga non la riporta. Le velocità ("transferred 111.7 MiB/s") non sono dimensioni.
+    """
+    match = _TRANSFERRED_RE.search(line)
+    if match is None or line.startswith("/s", match.end()):
+        return None
+    return f"{match.group(1)} {match.group(2)}"
+
+
+def _requested_bridge(net_config) -> Optional[str]:
+    """
+    Bridge richiesto in hw_config["network"] per una scheda. Accetta il solo nome ("vmbr1"),
+    una stringa di opzioni ("bridge=vmbr1,tag=5") o un dict ({"bridge": "vmbr1"}).
+    """
+    if isinstance(net_config, str):
+        options = {}
+        for part in net_config.split(","):
+            key, sep, value = part.strip().partition("=")
+            if sep:
+                options[key] = value
+            else:
+                # Assume sia solo il nome del bridge
+                options.setdefault("bridge", key)
+    elif isinstance(net_config, dict):
+        options = net_config
+    else:
+        return None
+    
+    bridge = str(options.get("bridge") or "")
+    # Rimuovi eventuali prefissi "bridge=" multipli
+    while bridge.startswith("bridge="):
+        bridge = bridge[7:]
+    return bridge.strip() or None
+
+
+def _with_bridge(net_config: str, bridge: str) -> str:
+    """Config della scheda con il bridge sostituito (o aggiunto), lasciando invariate le altre opzioni"""
+    parts = net_config.split(",")
+    for i, part in enumerate(parts):
+        if part.startswith("bridge="):
+            parts[i] = f"bridge={bridge}"
+            return ",".join(parts)
+    return f"{net_config},bridge={bridge}"
+
 
 class MigrationService:
     """Servizio per migrazione/copia VM tra nodi Proxmox"""
@@ -60,60 +124,58 @@ class MigrationService:
         Returns:
             Dict con success, message, vm_id, duration, transferred
         """
-        import time
-        start_time = time.time()
+        # Durata con orologio monotono: immune ai salti NTP durante una copia di un'ora
+        start_time = time.monotonic()
         
         cmd = "qm" if vm_type == "qemu" else "pct"
+        # Parametri di connessione comuni a tutti i comandi verso sorgente e destinazione
+        source_ssh_kw = {"hostname": source_hostname, "port": source_port, "username": source_user, "key_path": source_key}
+        dest_ssh_kw = {"hostname": dest_hostname, "port": dest_port, "username": dest_user, "key_path": dest_key}
         
         # Determina VMID destinazione
         target_vmid = dest_vm_id if dest_vm_id else vm_id
         
-        # Verifica che la VM esista sulla sorgente
+        # Verifica che la VM esista sulla sorgente e crea lo snapshot se richiesto:
+        # un solo comando remoto, il marker separa l'esito della verifica da quello dello snapshot
         check_cmd = f"{cmd} status {vm_id} 2>/dev/null"
-        check_result = await ssh_service.execute(
-            hostname=source_hostname,
-            command=check_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
-            timeout=30
+        prelude_cmd = check_cmd
+        snapshot_name = None
+        snap_cmd = None
+        if create_snapshot:
+            snapshot_name = f"migration-{int(time.time())}"
+            snap_cmd = f"{cmd} snapshot {vm_id} {snapshot_name} --description 'Pre-migration snapshot'"
+            prelude_cmd = f"{check_cmd} || exit $?; echo {_CHECK_OK_MARKER}; {snap_cmd}"
+        
+        prelude_result = await ssh_service.execute(
+            **source_ssh_kw,
+            command=prelude_cmd,
+            timeout=300 if create_snapshot else 30
+        )
+        check_ok = prelude_result.success or (
+            create_snapshot and _CHECK_OK_MARKER in prelude_result.stdout
         )
         
-        if not check_result.success:
+        if not check_ok:
             logger.error(f"[MIGRATION] FASE: VERIFICA VM SORGENTE FALLITA")
             logger.error(f"[MIGRATION] VM: {vm_id} | Host: {source_hostname}")
             logger.error(f"[MIGRATION] Comando: {check_cmd}")
-            logger.error(f"[MIGRATION] Exit code: {check_result.exit_code}")
-            logger.error(f"[MIGRATION] Stderr: {check_result.stderr}")
+            logger.error(f"[MIGRATION] Exit code: {prelude_result.exit_code}")
+            logger.error(f"[MIGRATION] Stderr: {prelude_result.stderr}")
             return {
                 "success": False,
                 "message": f"VM {vm_id} ({vm_type}) non trovata su {source_hostname}. Verifica che la VM esista e sia accessibile.",
-                "error": check_result.stderr or f"Comando '{check_cmd}' fallito con exit code {check_result.exit_code}",
+                "error": prelude_result.stderr or f"Comando '{check_cmd}' fallito con exit code {prelude_result.exit_code}",
                 "phase": "check_source_vm",
-                "exit_code": check_result.exit_code,
+                "exit_code": prelude_result.exit_code,
                 "command": check_cmd,
                 "source_host": source_hostname
             }
         
-        # Crea snapshot se richiesto
-        snapshot_name = None
-        if create_snapshot:
-            snapshot_name = f"migration-{int(time.time())}"
-            snap_cmd = f"{cmd} snapshot {vm_id} {snapshot_name} --description 'Pre-migration snapshot'"
-            snap_result = await ssh_service.execute(
-                hostname=source_hostname,
-                command=snap_cmd,
-                port=source_port,
-                username=source_user,
-                key_path=source_key,
-                timeout=300
-            )
-            
-            if not snap_result.success:
-                logger.warning(f"[MIGRATION] Snapshot pre-migrazione fallito (non bloccante)")
-                logger.warning(f"[MIGRATION] Comando: {snap_cmd}")
-                logger.warning(f"[MIGRATION] Stderr: {snap_result.stderr}")
-                # Continua comunque la migrazione
+        if create_snapshot and not prelude_result.success:
+            logger.warning(f"[MIGRATION] Snapshot pre-migrazione fallito (non bloccante)")
+            logger.warning(f"[MIGRATION] Comando: {snap_cmd}")
+            logger.warning(f"[MIGRATION] Stderr: {prelude_result.stderr}")
+            # Continua comunque la migrazione
         
         # Costruisci comando di migrazione
         # qm migrate <vmid> <target> [OPTIONS] - per migrazione tra nodi
@@ -174,13 +236,22 @@ class MigrationService:
         logger.info(f"[MIGRATION] VM: {vm_id} ({vm_type}) | {source_hostname} -> {target}")
         logger.info(f"[MIGRATION] Comando: {migrate_cmd}")
         
+        # Dimensione trasferita: aggiornata man mano che arrivano le righe di avanzamento,
+        # senza accumulare l'intero output di una migrazione che può durare un'ora
+        transferred = "0B"
+        
+        def track_transferred(line: str):
+            nonlocal transferred
+            # Solo righe "transferred <dimensione>": vale l'ultima, la più avanzata
+            size = _transferred_size(line)
+            if size:
+                transferred = size
+        
         # Esegui migrazione
-        migrate_result = await ssh_service.execute(
-            hostname=source_hostname,
+        migrate_result = await ssh_service.execute_stream(
+            **source_ssh_kw,
             command=migrate_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
+            on_line=track_transferred,
             timeout=3600  # 1 ora per migrazioni grandi
         )
         
@@ -208,62 +279,38 @@ class MigrationService:
                 "full_output": full_output
             }
         
-        # Estrai dimensione trasferita dall'output
-        transferred = "0B"
-        if "transferred" in migrate_result.stdout.lower() or "MiB" in migrate_result.stdout:
-            # Cerca pattern tipo "transferred 10.5 GiB"
-            match = re.search(r'(\d+\.?\d*)\s*(GiB|MiB|KiB|GB|MB|KB)', migrate_result.stdout, re.IGNORECASE)
-            if match:
-                transferred = f"{match.group(1)} {match.group(2)}"
-        
         # Applica riconfigurazione hardware se specificata
-        if hw_config:
+        if hw_config and (dest_vm_name_suffix or _HW_CONFIG_KEYS & hw_config.keys()):
             hw_result = await self._apply_hw_config(
-                hostname=dest_hostname,
+                **dest_ssh_kw,
                 vm_id=target_vmid,
                 vm_type=vm_type,
                 hw_config=hw_config,
-                dest_vm_name_suffix=dest_vm_name_suffix,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key
+                dest_vm_name_suffix=dest_vm_name_suffix
             )
             
             if not hw_result["success"]:
                 logger.warning(f"Errore applicazione config hardware: {hw_result.get('message')}")
                 # Non fallisce la migrazione, solo warning
         
-        # Gestione snapshot - esegui sempre il pruning se keep_snapshots > 0
-        if keep_snapshots > 0:
-            logger.info(f"[MIGRATION] Esecuzione pruning snapshot (keep={keep_snapshots})")
-            await self._prune_snapshots(
-                hostname=source_hostname,
-                vm_id=vm_id,
-                vm_type=vm_type,
-                keep=keep_snapshots,
-                port=source_port,
-                username=source_user,
-                key_path=source_key
-            )
-        else:
-            logger.info(f"[MIGRATION] Pruning snapshot saltato (keep_snapshots={keep_snapshots})")
-        
-        # Avvia VM se richiesto
-        if start_after:
-            start_cmd = f"{cmd} start {target_vmid}"
-            start_result = await ssh_service.execute(
-                hostname=dest_hostname,
-                command=start_cmd,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key,
-                timeout=60
-            )
-            
-            if not start_result.success:
-                logger.warning(f"Errore avvio VM: {start_result.stderr}")
+        # Pruning sulla sorgente e avvio sulla destinazione
+        await self._finalize(
+            source_hostname=source_hostname,
+            dest_hostname=dest_hostname,
+            vm_id=vm_id,
+            target_vmid=target_vmid,
+            vm_type=vm_type,
+            keep_snapshots=keep_snapshots,
+            start_after=start_after,
+            source_port=source_port,
+            source_user=source_user,
+            source_key=source_key,
+            dest_port=dest_port,
+            dest_user=dest_user,
+            dest_key=dest_key
+        )
         
-        duration = int(time.time() - start_time)
+        duration = int(time.monotonic() - start_time)
         
         logger.info(f"[MIGRATION] ========== MIGRAZIONE COMPLETATA ==========")
         logger.info(f"[MIGRATION] VM: {vm_id} -> {target_vmid} su {dest_hostname}")
@@ -301,8 +348,11 @@ class MigrationService:
         """
         Copia VM usando vzdump + restore (per copia tra nodi senza cluster)
         """
-        import time
-        start_time = time.time()
+        start_time = time.monotonic()
+        
+        cmd = "qm" if vm_type == "qemu" else "pct"
+        source_ssh_kw = {"hostname": source_hostname, "port": source_port, "username": source_user, "key_path": source_key}
+        dest_ssh_kw = {"hostname": dest_hostname, "port": dest_port, "username": dest_user, "key_path": dest_key}
         
         # vzdump funziona per entrambi qemu e lxc
         restore_cmd = "qmrestore" if vm_type == "qemu" else "pct restore"
@@ -310,13 +360,10 @@ class MigrationService:
         target_vmid = dest_vm_id if dest_vm_id else vm_id
         
         # Verifica se la VM destinazione esiste già
-        check_vm_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} status {target_vmid} 2>/dev/null"
+        check_vm_cmd = f"{cmd} status {target_vmid} 2>/dev/null"
         check_result = await ssh_service.execute(
-            hostname=dest_hostname,
+            **dest_ssh_kw,
             command=check_vm_cmd,
-            port=dest_port,
-            username=dest_user,
-            key_path=dest_key,
             timeout=30
         )
         
@@ -336,13 +383,10 @@ class MigrationService:
             logger.info(f"VM {target_vmid} esiste già su {dest_hostname}, la elimino prima di procedere")
             
             # Prima stoppa la VM se in esecuzione
-            stop_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} stop {target_vmid} --skiplock 2>/dev/null || true"
+            stop_cmd = f"{cmd} stop {target_vmid} --skiplock 2>/dev/null || true"
             await ssh_service.execute(
-                hostname=dest_hostname,
+                **dest_ssh_kw,
                 command=stop_cmd,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key,
                 timeout=60
             )
             
@@ -350,13 +394,10 @@ class MigrationService:
             await asyncio.sleep(3)
             
             # Elimina la VM
-            destroy_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} destroy {target_vmid} --purge --skiplock"
+            destroy_cmd = f"{cmd} destroy {target_vmid} --purge --skiplock"
             destroy_result = await ssh_service.execute(
-                hostname=dest_hostname,
+                **dest_ssh_kw,
                 command=destroy_cmd,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key,
                 timeout=120
             )
             
@@ -384,15 +425,12 @@ class MigrationService:
         snapshot_name = None
         if create_snapshot:
             snapshot_name = f"migration-{int(time.time())}"
-            snap_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} snapshot {vm_id} {snapshot_name} --description 'Pre-migration snapshot'"
+            snap_cmd = f"{cmd} snapshot {vm_id} {snapshot_name} --description 'Pre-migration snapshot'"
             logger.info(f"[MIGRATION] FASE: Creazione snapshot pre-migrazione")
             logger.info(f"[MIGRATION] VM: {vm_id} | Snapshot: {snapshot_name}")
             snap_result = await ssh_service.execute(
-                hostname=source_hostname,
+                **source_ssh_kw,
                 command=snap_cmd,
-                port=source_port,
-                username=source_user,
-                key_path=source_key,
                 timeout=300
             )
             if not snap_result.success:
@@ -405,13 +443,10 @@ class MigrationService:
         backup_dir = "/var/lib/vz/dump"
         
         # Stima dimensione VM (somma dischi)
-        size_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} config {vm_id} | grep -E '^(scsi|virtio|ide|sata|rootfs|mp)[0-9]*:' | grep -oP '\\d+G' | head -1"
+        size_cmd = f"{cmd} config {vm_id} | grep -E '^(scsi|virtio|ide|sata|rootfs|mp)[0-9]*:' | grep -oP '\\d+G' | head -1"
         size_result = await ssh_service.execute(
-            hostname=source_hostname,
+            **source_ssh_kw,
             command=size_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
             timeout=30
         )
         
@@ -428,11 +463,8 @@ class MigrationService:
         for test_dir in ["/var/lib/vz/dump", "/var/tmp", "/tmp"]:
             space_cmd = f"df -BG {test_dir} 2>/dev/null | tail -1 | awk '{{print $4}}' | tr -d 'G'"
             space_result = await ssh_service.execute(
-                hostname=source_hostname,
+                **source_ssh_kw,
                 command=space_cmd,
-                port=source_port,
-                username=source_user,
-                key_path=source_key,
                 timeout=30
             )
             
@@ -488,11 +520,8 @@ class MigrationService:
             logger.debug(f"[MIGRATION] Comando: {backup_cmd}")
             
             backup_result = await ssh_service.execute(
-                hostname=source_hostname,
+                **source_ssh_kw,
                 command=backup_cmd,
-                port=source_port,
-                username=source_user,
-                key_path=source_key,
                 timeout=3600
             )
             
@@ -562,11 +591,8 @@ class MigrationService:
         # vzdump crea file tipo: vzdump-qemu-100-2025_12_08-12_30_00.vma.zst o .tar.zst
         find_backup_cmd = f"ls -t {backup_dir}/vzdump-{vm_type}-{vm_id}-*.vma.zst {backup_dir}/vzdump-{vm_type}-{vm_id}-*.tar.zst 2>/dev/null | head -1"
         find_result = await ssh_service.execute(
-            hostname=source_hostname,
+            **source_ssh_kw,
             command=find_backup_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
             timeout=30
         )
         
@@ -594,11 +620,8 @@ class MigrationService:
         # Ottieni dimensione del backup
         size_cmd = f"stat -c%s {backup_file} 2>/dev/null || stat -f%z {backup_file} 2>/dev/null"
         size_result = await ssh_service.execute(
-            hostname=source_hostname,
+            **source_ssh_kw,
             command=size_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
             timeout=30
         )
         
@@ -628,16 +651,13 @@ class MigrationService:
         rsync_cmd = f"rsync -avz --progress --info=progress2 -e 'ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -i {source_key} -p {dest_port}' {backup_file} {dest_user}@{dest_hostname}:/var/tmp/"
         
         # Esegui rsync e monitora il progresso
-        transfer_start = time.time()
+        transfer_start = time.monotonic()
         transfer_result = await ssh_service.execute(
-            hostname=source_hostname,
+            **source_ssh_kw,
             command=rsync_cmd,
-            port=source_port,
-            username=source_user,
-            key_path=source_key,
             timeout=7200  # 2 ore per file grandi
         )
-        transfer_duration = time.time() - transfer_start
+        transfer_duration = time.monotonic() - transfer_start
         
         # Calcola velocità trasferimento
         if backup_size_bytes > 0 and transfer_duration > 0:
@@ -649,22 +669,16 @@ class MigrationService:
             logger.warning(f"rsync fallito, provo con scp: {transfer_result.stderr}")
             scp_cmd = f"scp -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -i {source_key} -P {dest_port} {backup_file} {dest_user}@{dest_hostname}:/var/tmp/"
             transfer_result = await ssh_service.execute(
-                hostname=source_hostname,
+                **source_ssh_kw,
                 command=scp_cmd,
-                port=source_port,
-                username=source_user,
-                key_path=source_key,
                 timeout=7200
             )
         
         if not transfer_result.success:
             # Cleanup backup locale
             await ssh_service.execute(
-                hostname=source_hostname,
-                command=f"rm -f {backup_file}",
-                port=source_port,
-                username=source_user,
-                key_path=source_key
+                **source_ssh_kw,
+                command=f"rm -f {backup_file}"
             )
             full_output = f"STDOUT:\n{transfer_result.stdout}\n\nSTDERR:\n{transfer_result.stderr}"
             logger.error(f"[MIGRATION] FASE: TRASFERIMENTO FALLITO")
@@ -701,11 +715,8 @@ class MigrationService:
         if not dest_storage:
             find_storage_cmd = "pvesm status --content images 2>/dev/null | awk 'NR>1 {print $1}' | head -1"
             storage_result = await ssh_service.execute(
-                hostname=dest_hostname,
+                **dest_ssh_kw,
                 command=find_storage_cmd,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key,
                 timeout=30
             )
             if storage_result.success and storage_result.stdout.strip():
@@ -715,11 +726,8 @@ class MigrationService:
                 for fallback in ["local-lvm", "local-zfs", "zfs", "lvm"]:
                     check_cmd = f"pvesm status | grep -q '^{fallback}' && echo 'found'"
                     check_result = await ssh_service.execute(
-                        hostname=dest_hostname,
+                        **dest_ssh_kw,
                         command=check_cmd,
-                        port=dest_port,
-                        username=dest_user,
-                        key_path=dest_key,
                         timeout=10
                     )
                     if check_result.success and "found" in check_result.stdout:
@@ -743,31 +751,34 @@ class MigrationService:
             restore_cmd = f"pct restore {target_vmid} {remote_backup} --storage {dest_storage}"
         else:
             restore_cmd = f"qmrestore {remote_backup} {target_vmid} --storage {dest_storage}"
-        restore_result = await ssh_service.execute(
-            hostname=dest_hostname,
+        
+        # Dimensione trasferita: letta dalle righe di avanzamento mentre il restore procede
+        transferred = "0B"
+        
+        def track_transferred(line: str):
+            nonlocal transferred
+            # Solo righe "transferred <dimensione>": vale l'ultima, la più avanzata
+            size = _transferred_size(line)
+            if size:
+                transferred = size
+        
+        restore_result = await ssh_service.execute_stream(
+            **dest_ssh_kw,
             command=restore_cmd,
-            port=dest_port,
-            username=dest_user,
-            key_path=dest_key,
+            on_line=track_transferred,
             timeout=3600
         )
         
         # Cleanup backup remoto
         await ssh_service.execute(
-            hostname=dest_hostname,
-            command=f"rm -f {remote_backup}",
-            port=dest_port,
-            username=dest_user,
-            key_path=dest_key
+            **dest_ssh_kw,
+            command=f"rm -f {remote_backup}"
         )
         
         # Cleanup backup locale
         await ssh_service.execute(
-            hostname=source_hostname,
-            command=f"rm -f {backup_file}",
-            port=source_port,
-            username=source_user,
-            key_path=source_key
+            **source_ssh_kw,
+            command=f"rm -f {backup_file}"
         )
         
         if not restore_result.success:
@@ -797,58 +808,36 @@ class MigrationService:
                 "full_output": full_output
             }
         
-        # Estrai dimensione trasferita
-        transferred = "0B"
-        if "transferred" in restore_result.stdout.lower() or "MiB" in restore_result.stdout:
-            match = re.search(r'(\d+\.?\d*)\s*(GiB|MiB|KiB|GB|MB|KB)', restore_result.stdout, re.IGNORECASE)
-            if match:
-                transferred = f"{match.group(1)} {match.group(2)}"
-        
         # Applica riconfigurazione hardware
-        if hw_config:
+        if hw_config and (dest_vm_name_suffix or _HW_CONFIG_KEYS & hw_config.keys()):
             hw_result = await self._apply_hw_config(
-                hostname=dest_hostname,
+                **dest_ssh_kw,
                 vm_id=target_vmid,
                 vm_type=vm_type,
                 hw_config=hw_config,
-                dest_vm_name_suffix=dest_vm_name_suffix,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key
+                dest_vm_name_suffix=dest_vm_name_suffix
             )
             if not hw_result["success"]:
                 logger.warning(f"Errore applicazione config hardware: {hw_result.get('message')}")
         
-        # Gestione snapshot - esegui sempre il pruning se keep_snapshots > 0
-        if keep_snapshots > 0:
-            logger.info(f"[MIGRATION] Esecuzione pruning snapshot (keep={keep_snapshots})")
-            await self._prune_snapshots(
-                hostname=source_hostname,
-                vm_id=vm_id,
-                vm_type=vm_type,
-                keep=keep_snapshots,
-                port=source_port,
-                username=source_user,
-                key_path=source_key
-            )
-        else:
-            logger.info(f"[MIGRATION] Pruning snapshot saltato (keep_snapshots={keep_snapshots})")
-        
-        # Avvia VM se richiesto
-        if start_after:
-            start_cmd = f"{'qm' if vm_type == 'qemu' else 'pct'} start {target_vmid}"
-            start_result = await ssh_service.execute(
-                hostname=dest_hostname,
-                command=start_cmd,
-                port=dest_port,
-                username=dest_user,
-                key_path=dest_key,
-                timeout=60
-            )
-            if not start_result.success:
-                logger.warning(f"Errore avvio VM: {start_result.stderr}")
+        # Pruning sulla sorgente e avvio sulla destinazione
+        await self._finalize(
+            source_hostname=source_hostname,
+            dest_hostname=dest_hostname,
+            vm_id=vm_id,
+            target_vmid=target_vmid,
+            vm_type=vm_type,
+            keep_snapshots=keep_snapshots,
+            start_after=start_after,
+            source_port=source_port,
+            source_user=source_user,
+            source_key=source_key,
+            dest_port=dest_port,
+            dest_user=dest_user,
+            dest_key=dest_key
+        )
         
-        duration = int(time.time() - start_time)
+        duration = int(time.monotonic() - start_time)
         
         # Usa backup_size_human se transferred non è stato calcolato
         final_transferred = backup_size_human if backup_size_human != "N/A" else transferred
@@ -868,6 +857,86 @@ class MigrationService:
             "snapshot_created": snapshot_name if create_snapshot else None
         }
     
+    async def _finalize(
+        self,
+        source_hostname: str,
+        dest_hostname: str,
+        vm_id: int,
+        target_vmid: int,
+        vm_type: str,
+        keep_snapshots: int,
+        start_after: bool,
+        source_port: int = 22,
+        source_user: str = "root",
+        source_key: str = "/root/.ssh/id_rsa",
+        dest_port: int = 22,
+        dest_user: str = "root",
+        dest_key: str = "/root/.ssh/id_rsa"
+    ):
+        """
+        Pruning degli snapshot sulla sorgente e avvio della VM sulla destinazione.
+        Agiscono su host diversi e non hanno vincoli d'ordine: partono insieme.
+        """
+        cmd = "qm" if vm_type == "qemu" else "pct"
+        source_ssh_kw = {"hostname": source_hostname, "port": source_port, "username": source_user, "key_path": source_key}
+        dest_ssh_kw = {"hostname": dest_hostname, "port": dest_port, "username": dest_user, "key_path": dest_key}
+        tasks = []
+        
+        # Gestione snapshot - esegui sempre il pruning se keep_snapshots > 0
+        if keep_snapshots > 0:
+            logger.info(f"[MIGRATION] Esecuzione pruning snapshot (keep={keep_snapshots})")
+            tasks.append(self._prune_snapshots(
+                **source_ssh_kw,
+                vm_id=vm_id,
+                vm_type=vm_type,
+                keep=keep_snapshots
+            ))
+        else:
+            logger.info(f"[MIGRATION] Pruning snapshot saltato (keep_snapshots={keep_snapshots})")
+        
+        # Avvia VM se richiesto
+        if start_after:
+            tasks.append(ssh_service.execute(
+                **dest_ssh_kw,
+                command=f"{cmd} start {target_vmid}",
+                timeout=60
+            ))
+        
+        for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.warning(f"[MIGRATION] Errore nella fase finale: {outcome}")
+            elif isinstance(outcome, SSHResult) and not outcome.success:
+                logger.warning(f"Errore avvio VM: {outcome.stderr}")
+    
+    async def _read_config(
+        self,
+        hostname: str,
+        vm_id: int,
+        vm_type: str,
+        port: int = 22,
+        username: str = "root",
+        key_path: str = "/root/.ssh/id_rsa"
+    ) -> Optional[Dict[str, str]]:
+        """Legge la config della VM con un solo comando e la restituisce come dict chiave -> valore"""
+        cmd = "qm" if vm_type == "qemu" else "pct"
+        ssh_kw = {"hostname": hostname, "port": port, "username": username, "key_path": key_path}
+        result = await ssh_service.execute(
+            **ssh_kw,
+            command=f"{cmd} config {vm_id}",
+            timeout=30
+        )
+        if not result.success:
+            logger.warning(f"Impossibile leggere la config della VM {vm_id} su {hostname}: {result.stderr}")
+            return None
+        
+        # Formato output: una riga "chiave: valore" per opzione (es: "net0: virtio=...,bridge=vmbr0")
+        config = {}
+        for line in result.stdout.splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                config[key.strip()] = value.strip()
+        return config
+    
     async def _apply_hw_config(
         self,
         hostname: str,
@@ -877,215 +946,99 @@ class MigrationService:
         dest_vm_name_suffix: Optional[str] = None,
         port: int = 22,
         username: str = "root",
-        key_path: str = "/root/.ssh/id_rsa"
+        key_path: str = "/root/.ssh/id_rsa",
+        max_parallel_moves: int = MIGRATION_MAX_PARALLEL_MOVES
     ) -> Dict:
         """Applica riconfigurazione hardware alla VM"""
         logger.info(f"=== Applicando hw_config a VM {vm_id} su {hostname} ===")
         logger.info(f"hw_config ricevuto: {json.dumps(hw_config, default=str)}")
         
         cmd = "qm" if vm_type == "qemu" else "pct"
+        ssh_kw = {"hostname": hostname, "port": port, "username": username, "key_path": key_path}
         changes = []
         
+        # Nome, schede di rete e dischi si ricavano da un'unica lettura della config
+        config = {}
+        if dest_vm_name_suffix or "network" in hw_config or "storage" in hw_config:
+            config = await self._read_config(vm_id=vm_id, vm_type=vm_type, **ssh_kw) or {}
+        
+        # Opzioni da applicare con un solo qm/pct set (accetta più --chiave valore): (opzione, modifica)
+        options = []
+        
         # Modifica nome VM
-        if dest_vm_name_suffix:
-            # Leggi nome attuale
-            config_result = await ssh_service.execute(
-                hostname=hostname,
-                command=f"{cmd} config {vm_id} | grep '^name:'",
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=30
-            )
-            
-            if config_result.success and config_result.stdout.strip():
-                current_name = config_result.stdout.strip().split(":", 1)[1].strip()
-                new_name = current_name + dest_vm_name_suffix
-                set_name_cmd = f"{cmd} set {vm_id} --name '{new_name}'"
-                name_result = await ssh_service.execute(
-                    hostname=hostname,
-                    command=set_name_cmd,
-                    port=port,
-                    username=username,
-                    key_path=key_path,
-                    timeout=30
-                )
-                if name_result.success:
-                    changes.append(f"nome: {new_name}")
+        if dest_vm_name_suffix and config.get("name"):
+            new_name = config["name"] + dest_vm_name_suffix
+            options.append((f"--name {shlex.quote(new_name)}", f"nome: {new_name}"))
         
-        # Modifica RAM
+        # Modifica RAM e CPU (valori dell'utente: quotati, finiscono in un comando di shell)
         if "memory" in hw_config:
-            mem = hw_config["memory"]
-            mem_cmd = f"{cmd} set {vm_id} --memory {mem}"
-            mem_result = await ssh_service.execute(
-                hostname=hostname,
-                command=mem_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=30
-            )
-            if mem_result.success:
-                changes.append(f"RAM: {mem}MB")
-        
-        # Modifica CPU cores
+            options.append((f"--memory {shlex.quote(str(hw_config['memory']))}", f"RAM: {hw_config['memory']}MB"))
         if "cores" in hw_config:
-            cores = hw_config["cores"]
-            cores_cmd = f"{cmd} set {vm_id} --cores {cores}"
-            cores_result = await ssh_service.execute(
-                hostname=hostname,
-                command=cores_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=30
-            )
-            if cores_result.success:
-                changes.append(f"cores: {cores}")
-        
-        # Modifica CPU sockets
+            options.append((f"--cores {shlex.quote(str(hw_config['cores']))}", f"cores: {hw_config['cores']}"))
         if "sockets" in hw_config:
-            sockets = hw_config["sockets"]
-            sockets_cmd = f"{cmd} set {vm_id} --sockets {sockets}"
-            sockets_result = await ssh_service.execute(
-                hostname=hostname,
-                command=sockets_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=30
-            )
-            if sockets_result.success:
-                changes.append(f"sockets: {sockets}")
-        
-        # Modifica CPU type
+            options.append((f"--sockets {shlex.quote(str(hw_config['sockets']))}", f"sockets: {hw_config['sockets']}"))
         if "cpu" in hw_config:
-            cpu_type = hw_config["cpu"]
-            cpu_cmd = f"{cmd} set {vm_id} --cpu {cpu_type}"
-            cpu_result = await ssh_service.execute(
-                hostname=hostname,
-                command=cpu_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
+            options.append((f"--cpu {shlex.quote(str(hw_config['cpu']))}", f"CPU: {hw_config['cpu']}"))
+        
+        # Modifica network (bridge): i bridge richiesti sono normalizzati una volta sola
+        bridges = {iface: _requested_bridge(net_config) for iface, net_config in hw_config.get("network", {}).items()}
+        for net_iface, new_bridge in bridges.items():
+            # Config attuale della scheda (es: "virtio=AA:BB:CC:DD:EE:FF,bridge=vmbr0,firewall=1")
+            current_config = config.get(net_iface)
+            if not current_config:
+                logger.warning(f"Interfaccia {net_iface} non trovata sulla VM {vm_id}")
+                continue
+            logger.info(f"Config attuale {net_iface}: {current_config}")
+            
+            if not new_bridge:
+                logger.warning(f"Bridge non specificato per {net_iface}")
+                continue
+            
+            new_config = _with_bridge(current_config, new_bridge)
+            logger.info(f"Nuova config {net_iface}: {new_config}")
+            options.append((f"--{net_iface} {shlex.quote(new_config)}", f"{net_iface}: bridge={new_bridge}"))
+        
+        if options:
+            set_cmd = f"{cmd} set {vm_id} {' '.join(option for option, _ in options)}"
+            set_result = await ssh_service.execute(
+                **ssh_kw,
+                command=set_cmd,
                 timeout=30
             )
-            if cpu_result.success:
-                changes.append(f"CPU: {cpu_type}")
-        
-        # Modifica network (bridge)
-        if "network" in hw_config:
-            for net_iface, net_config in hw_config["network"].items():
-                # Prima leggi la configurazione attuale della scheda di rete
-                get_net_cmd = f"{cmd} config {vm_id} | grep '^{net_iface}:'"
-                get_net_result = await ssh_service.execute(
-                    hostname=hostname,
-                    command=get_net_cmd,
-                    port=port,
-                    username=username,
-                    key_path=key_path,
-                    timeout=30
-                )
-                
-                if not get_net_result.success or not get_net_result.stdout.strip():
-                    logger.warning(f"Interfaccia {net_iface} non trovata sulla VM {vm_id}")
-                    continue
-                
-                # Estrai la config attuale (es: "net0: virtio=AA:BB:CC:DD:EE:FF,bridge=vmbr0,firewall=1")
-                current_config = get_net_result.stdout.strip().split(":", 1)[1].strip()
-                logger.info(f"Config attuale {net_iface}: {current_config}")
-                
-                # Determina il nuovo bridge
-                new_bridge = None
-                if isinstance(net_config, str):
-                    # Rimuovi eventuali prefissi "bridge=" multipli
-                    clean_config = net_config
-                    while clean_config.startswith("bridge="):
-                        clean_config = clean_config[7:]  # Rimuovi "bridge="
-                    
-                    # Cerca bridge= nel valore pulito o usa il valore direttamente
-                    bridge_match = re.search(r'bridge=([^,\s]+)', clean_config)
-                    if bridge_match:
-                        new_bridge = bridge_match.group(1)
-                    else:
-                        # Assume sia solo il nome del bridge
-                        new_bridge = clean_config.strip()
-                elif isinstance(net_config, dict) and "bridge" in net_config:
-                    new_bridge = net_config["bridge"]
-                    # Rimuovi eventuali prefissi "bridge=" dal valore dict
-                    while new_bridge.startswith("bridge="):
-                        new_bridge = new_bridge[7:]
-                
-                if not new_bridge:
-                    logger.warning(f"Bridge non specificato per {net_iface}")
-                    continue
-                
-                # Assicurati che new_bridge sia solo il nome del bridge (senza prefissi)
-                new_bridge = new_bridge.strip()
-                logger.debug(f"Bridge pulito per {net_iface}: {new_bridge}")
-                
-                # Sostituisci il bridge nella config esistente
-                new_config = re.sub(r'bridge=[^,\s]+', f'bridge={new_bridge}', current_config)
-                
-                # Se non c'era un bridge nella config, aggiungilo
-                if 'bridge=' not in new_config:
-                    new_config = f"{new_config},bridge={new_bridge}"
-                
-                logger.info(f"Nuova config {net_iface}: {new_config}")
-                
-                # Applica la nuova configurazione
-                net_cmd = f"{cmd} set {vm_id} --{net_iface} {new_config}"
-                net_result = await ssh_service.execute(
-                    hostname=hostname,
-                    command=net_cmd,
-                    port=port,
-                    username=username,
-                    key_path=key_path,
-                    timeout=30
-                )
-                
-                if net_result.success:
-                    changes.append(f"{net_iface}: bridge={new_bridge}")
-                    logger.info(f"Bridge {net_iface} cambiato a {new_bridge}")
-                else:
-                    logger.error(f"Errore cambio bridge {net_iface}: {net_result.stderr}")
+            if set_result.success:
+                changes.extend(change for _, change in options)
+            else:
+                logger.error(f"Errore {set_cmd}: {set_result.stderr}")
+        
+        # Modifica storage (sposta dischi): dopo le modifiche di config,
+        # perché lo spostamento tiene il lock della VM per tutta la copia
+        moves = []
+        for disk, new_storage in hw_config.get("storage", {}).items():
+            # new_storage può essere "local-lvm:vm-100-disk-0" o solo "local-lvm"
+            storage_name = new_storage.split(":", 1)[0]
+            if ":" not in new_storage and disk not in config:
+                continue
+            moves.append((disk, storage_name))
         
-        # Modifica storage (sposta dischi)
-        if "storage" in hw_config:
-            for disk, new_storage in hw_config["storage"].items():
-                # new_storage può essere "local-lvm:vm-100-disk-0" o solo "local-lvm"
-                if ":" in new_storage:
-                    storage_name, volume = new_storage.split(":", 1)
-                else:
-                    storage_name = new_storage
-                    # Leggi volume attuale
-                    config_result = await ssh_service.execute(
-                        hostname=hostname,
-                        command=f"{cmd} config {vm_id} | grep '^{disk}:'",
-                        port=port,
-                        username=username,
-                        key_path=key_path,
-                        timeout=30
-                    )
-                    if config_result.success and config_result.stdout.strip():
-                        # Estrai volume attuale
-                        current = config_result.stdout.strip().split(":", 1)[1].strip().split(",")[0]
-                        volume = current.split("/")[-1] if "/" in current else current
-                    else:
-                        continue
-                
-                # Sposta disco
-                move_cmd = f"{cmd} disk move {vm_id} {disk} --storage {storage_name}"
+        move_slots = asyncio.Semaphore(max(1, max_parallel_moves))
+        
+        async def move_disk(disk: str, storage_name: str) -> Optional[str]:
+            async with move_slots:
                 move_result = await ssh_service.execute(
-                    hostname=hostname,
-                    command=move_cmd,
-                    port=port,
-                    username=username,
-                    key_path=key_path,
+                    **ssh_kw,
+                    command=f"{cmd} disk move {vm_id} {shlex.quote(disk)} --storage {shlex.quote(storage_name)}",
                     timeout=600  # 10 minuti per spostamento disco
                 )
-                if move_result.success:
-                    changes.append(f"{disk} -> {storage_name}")
+            if not move_result.success:
+                logger.error(f"Errore spostamento {disk} su {storage_name}: {move_result.stderr}")
+                return None
+            return f"{disk} -> {storage_name}"
+        
+        for outcome in await asyncio.gather(*(move_disk(d, st) for d, st in moves), return_exceptions=True):
+            if isinstance(outcome, Exception):
+                logger.error(f"Errore spostamento disco VM {vm_id}: {outcome}")
+            elif outcome:
+                changes.append(outcome)
         
         return {
             "success": True,
@@ -1105,6 +1058,7 @@ class MigrationService:
     ):
         """Mantiene solo gli ultimi N snapshot di migrazione, elimina i più vecchi"""
         cmd = "qm" if vm_type == "qemu" else "pct"
+        ssh_kw = {"hostname": hostname, "port": port, "username": username, "key_path": key_path}
         
         logger.info(f"[MIGRATION] FASE: PRUNING SNAPSHOT")
         logger.info(f"[MIGRATION] VM: {vm_id} ({vm_type}) | Host: {hostname} | Keep: {keep}")
@@ -1112,11 +1066,8 @@ class MigrationService:
         # Lista snapshot - usa comando raw senza grep per parsare correttamente
         list_cmd = f"{cmd} listsnapshot {vm_id} 2>/dev/null"
         list_result = await ssh_service.execute(
-            hostname=hostname,
+            **ssh_kw,
             command=list_cmd,
-            port=port,
-            username=username,
-            key_path=key_path,
             timeout=30
         )
         
@@ -1132,30 +1083,19 @@ class MigrationService:
         snapshots = []
         migration_snapshots = []  # Solo snapshot di migrazione (migration-*)
         
-        for line in list_result.stdout.strip().split('\n'):
-            line = line.strip()
-            if not line:
+        for line in list_result.stdout.splitlines():
+            # Rimuovi prefisso `-> e indentazione, poi estrai il nome (prima parola)
+            parts = line.rsplit('`->', 1)[-1].split(None, 1)
+            if not parts:
                 continue
-            
+            snap_name = parts[0]
             # Salta la riga 'current'
-            if line.lower().startswith('current'):
+            if snap_name.lower() == 'current':
                 continue
-            
-            # Rimuovi prefisso `-> se presente
-            if '`->' in line:
-                line = line.split('`->')[-1].strip()
-            
-            # Estrai nome snapshot (prima parola)
-            parts = line.split()
-            if parts:
-                snap_name = parts[0]
-                # Salta 'current' ovunque appaia
-                if snap_name.lower() == 'current':
-                    continue
-                snapshots.append(snap_name)
-                # Identifica snapshot di migrazione
-                if snap_name.startswith('migration-'):
-                    migration_snapshots.append(snap_name)
+            snapshots.append(snap_name)
+            # Identifica snapshot di migrazione
+            if snap_name.startswith('migration-'):
+                migration_snapshots.append(snap_name)
         
         logger.info(f"[MIGRATION] Trovati {len(snapshots)} snapshot totali, {len(migration_snapshots)} di migrazione")
         logger.debug(f"[MIGRATION] Tutti gli snapshot: {snapshots}")
@@ -1184,29 +1124,46 @@ class MigrationService:
         
         logger.info(f"[MIGRATION] Eliminazione {len(to_delete)} snapshot: {to_delete}")
         
+        # Un delsnapshot alla volta (Proxmox blocca la VM con lock snapshot-delete durante
+        # l'eliminazione), ma tutti nello stesso comando remoto: dopo ognuno il marker
+        # riporta nome ed exit code, preceduti dall'output di quell'eliminazione
+        del_cmd = "; ".join(
+            f"{cmd} delsnapshot {vm_id} {snap_name} 2>&1; echo \"{_SNAPSHOT_DELETED_MARKER} {snap_name} $?\""
+            for snap_name in to_delete
+        )
+        del_result = await ssh_service.execute(
+            **ssh_kw,
+            command=del_cmd,
+            timeout=300 * len(to_delete)
+        )
+        
         deleted_count = 0
         failed_count = 0
+        output = []
+        reported = set()
         
-        for snap_name in to_delete:
-            del_cmd = f"{cmd} delsnapshot {vm_id} {snap_name}"
-            logger.info(f"[MIGRATION] Eliminazione snapshot: {snap_name}")
-            
-            del_result = await ssh_service.execute(
-                hostname=hostname,
-                command=del_cmd,
-                port=port,
-                username=username,
-                key_path=key_path,
-                timeout=300
-            )
-            
-            if del_result.success:
+        for line in del_result.stdout.splitlines():
+            if not line.startswith(_SNAPSHOT_DELETED_MARKER):
+                output.append(line)
+                continue
+            _, snap_name, exit_code = line.split()
+            reported.add(snap_name)
+            if exit_code == "0":
                 deleted_count += 1
                 logger.info(f"[MIGRATION] ✓ Snapshot {snap_name} eliminato")
             else:
                 failed_count += 1
                 logger.error(f"[MIGRATION] ✗ Errore eliminazione snapshot {snap_name}")
-                logger.error(f"[MIGRATION] Comando: {del_cmd}")
+                logger.error(f"[MIGRATION] Comando: {cmd} delsnapshot {vm_id} {snap_name}")
+                logger.error(f"[MIGRATION] Exit code: {exit_code}")
+                logger.error(f"[MIGRATION] Output: {chr(10).join(output)}")
+            output = []
+        
+        # Snapshot senza marker: il comando si è interrotto prima (timeout, connessione persa)
+        for snap_name in to_delete:
+            if snap_name not in reported:
+                failed_count += 1
+                logger.error(f"[MIGRATION] ✗ Eliminazione snapshot {snap_name} non eseguita")
                 logger.error(f"[MIGRATION] Exit code: {del_result.exit_code}")
                 logger.error(f"[MIGRATION] Stderr: {del_result.stderr}")
         
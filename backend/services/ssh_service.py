@@ -3,19 +3,49 @@ SSH Service - Gestione connessioni SSH ai nodi Proxmox
 """
 
 import asyncio
+import select
+import threading
+import time
 import paramiko
-from typing import Optional, Tuple, List, Dict
+from collections import deque
+from typing import Callable, Optional, Tuple, List, Dict
 import logging
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# Attese (secondi) tra i tentativi quando sshd rifiuta la connessione
+SSH_CONNECT_RETRY_DELAYS = (1, 2, 4)
+
+# Attese (secondi) tra i tentativi quando sshd rifiuta un nuovo canale (MaxSessions superato)
+SSH_CHANNEL_RETRY_DELAYS = (0.5, 1, 2)
+
+# Keepalive sulle connessioni riusate, per non perderle dietro NAT/firewall
+SSH_KEEPALIVE_INTERVAL = 30
+
+# execute_stream: righe di stdout conservate per la diagnostica e dimensione delle letture
+SSH_STREAM_TAIL_LINES = 200
+SSH_STREAM_CHUNK_SIZE = 32768
+
+
+def _is_transient_connect_error(exc: Exception) -> bool:
+    """True se l'errore di connessione è dovuto a sshd saturo e vale la pena riprovare"""
+    if isinstance(exc, (ConnectionRefusedError, ConnectionResetError,
+                        paramiko.ssh_exception.NoValidConnectionsError)):
+        return True
+    # Con MaxStartups superato sshd chiude la connessione prima del banner
+    return (
+        isinstance(exc, paramiko.SSHException)
+        and not isinstance(exc, paramiko.AuthenticationException)
+        and "banner" in str(exc).lower()
+    )
+
 
 @dataclass
 class SSHResult:
     """Risultato di un comando SSH"""
     success: bool
-    stdout: str
+    stdout: str  # bytes se il comando è eseguito con encoding=None
     stderr: str
     exit_code: int
 
@@ -25,6 +55,36 @@ class SSHService:
     
     def __init__(self):
         self._connections: Dict[str, paramiko.SSHClient] = {}
+        # Un lock per connessione: thread concorrenti non aprono connessioni duplicate
+        self._connect_locks: Dict[str, threading.Lock] = {}
+        self._connect_locks_guard = threading.Lock()
+    
+    async def _connect(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        key_path: str
+    ) -> Optional[str]:
+        """
+        Apre (o riusa) la connessione SSH, riprovando con backoff esponenziale
+        se sshd la rifiuta. Restituisce il messaggio d'errore in caso di fallimento.
+        """
+        client = self._connections.get(f"{username}@{hostname}:{port}")
+        transport = client.get_transport() if client else None
+        if transport and transport.is_active():
+            return None
+        
+        loop = asyncio.get_event_loop()
+        for delay in (*SSH_CONNECT_RETRY_DELAYS, None):
+            try:
+                await loop.run_in_executor(None, self._get_client, hostname, port, username, key_path)
+                return None
+            except Exception as e:
+                if delay is None or not _is_transient_connect_error(e):
+                    return str(e)
+                logger.warning(f"Connessione SSH a {hostname} rifiutata, nuovo tentativo tra {delay}s")
+                await asyncio.sleep(delay)
     
     def _get_client(
         self, 
@@ -36,6 +96,21 @@ class SSHService:
         """Ottiene o crea una connessione SSH"""
         key = f"{username}@{hostname}:{port}"
         
+        with self._connect_locks_guard:
+            lock = self._connect_locks.setdefault(key, threading.Lock())
+        
+        with lock:
+            return self._get_client_locked(key, hostname, port, username, key_path)
+    
+    def _get_client_locked(
+        self,
+        key: str,
+        hostname: str,
+        port: int,
+        username: str,
+        key_path: str
+    ) -> paramiko.SSHClient:
+        """Riusa la connessione attiva per key o ne apre una nuova (chiamare con il lock acquisito)"""
         if key in self._connections:
             client = self._connections[key]
             # Verifica se la connessione è ancora attiva
@@ -61,12 +136,89 @@ class SSHService:
                 timeout=10,
                 banner_timeout=10
             )
+            client.get_transport().set_keepalive(SSH_KEEPALIVE_INTERVAL)
             self._connections[key] = client
             return client
         except Exception as e:
             logger.error(f"Errore connessione SSH a {hostname}: {e}")
             raise
     
+    def _drop_client(self, hostname: str, port: int, username: str):
+        """Chiude e rimuove dal pool la connessione verso un host"""
+        client = self._connections.pop(f"{username}@{hostname}:{port}", None)
+        if client:
+            try:
+                client.close()
+            except Exception:
+                pass
+    
+    def _open_command(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        key_path: str,
+        command: str,
+        timeout: int
+    ):
+        """Avvia il comando sulla connessione del pool e restituisce (stdout, stderr)"""
+        client = self._get_client(hostname, port, username, key_path)
+        try:
+            stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+        except paramiko.ChannelException:
+            # Canale rifiutato (MaxSessions): la connessione è sana, non va ricreata.
+            # Il nuovo tentativo lo gestisce _run, fuori dal thread
+            raise
+        except (paramiko.SSHException, EOFError) as e:
+            # Il canale non si apre sulla connessione riusata (es. chiusa dal server):
+            # il comando non è partito, si ricrea la connessione e si riprova una volta
+            logger.debug(f"Canale SSH verso {hostname} non disponibile ({e}), riconnessione")
+            self._drop_client(hostname, port, username)
+            client = self._get_client(hostname, port, username, key_path)
+            stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+        return stdout, stderr
+    
+    async def _run(
+        self,
+        hostname: str,
+        port: int,
+        username: str,
+        key_path: str,
+        run: Callable[[], SSHResult],
+        empty_stdout
+    ) -> SSHResult:
+        """
+        Apre (o riusa) la connessione ed esegue run in un thread del pool.
+        Nessun limite di concorrenza qui: backup, sync e migrazioni tengono il comando
+        aperto per ore, il fan-out va limitato dal chiamante (es. HostInfoService.get_many).
+        """
+        error = await self._connect(hostname, port, username, key_path)
+        if error is not None:
+            return SSHResult(
+                success=False,
+                stdout=empty_stdout,
+                stderr=error,
+                exit_code=-1
+            )
+        
+        # Se sshd rifiuta il canale (MaxSessions superato) il comando non è partito:
+        # si attende con asyncio.sleep, senza tenere occupato un thread dell'executor
+        loop = asyncio.get_event_loop()
+        for delay in (*SSH_CHANNEL_RETRY_DELAYS, None):
+            try:
+                return await loop.run_in_executor(None, run)
+            except paramiko.ChannelException as e:
+                if delay is None:
+                    logger.error(f"Errore esecuzione comando su {hostname}: {e}")
+                    return SSHResult(
+                        success=False,
+                        stdout=empty_stdout,
+                        stderr=str(e),
+                        exit_code=-1
+                    )
+                logger.warning(f"Canale SSH verso {hostname} rifiutato ({e}), nuovo tentativo tra {delay}s")
+                await asyncio.sleep(delay)
+    
     async def execute(
         self,
         hostname: str,
@@ -74,16 +226,33 @@ class SSHService:
         port: int = 22,
         username: str = "root",
         key_path: str = "/root/.ssh/id_rsa",
-        timeout: int = 300
+        timeout: int = 300,
+        encoding: Optional[str] = "utf-8",
+        deadline: Optional[float] = None
     ) -> SSHResult:
-        """Esegue un comando su un nodo remoto"""
+        """
+        Esegue un comando su un nodo remoto.
+        Con encoding=None lo stdout è restituito come bytes, senza decodifica.
+        Con deadline il comando che non termina entro deadline secondi viene interrotto
+        e riportato come fallito; senza, si attende la fine del comando come sempre.
+        """
+        empty_stdout = "" if encoding else b""
+        
         def _execute():
             try:
-                client = self._get_client(hostname, port, username, key_path)
-                stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+                stdout, stderr = self._open_command(hostname, port, username, key_path, command, timeout)
                 
-                exit_code = stdout.channel.recv_exit_status()
-                stdout_text = stdout.read().decode('utf-8', errors='replace')
+                # Solo per chi passa deadline (raccolte brevi come host info): un comando bloccato,
+                # es. pvesm su uno storage di rete irraggiungibile, non trattiene per sempre il thread.
+                # Backup, sync e migrazioni attendono invece la fine del comando senza limite
+                channel = stdout.channel
+                if deadline is not None and not channel.status_event.wait(deadline):
+                    channel.close()
+                    raise TimeoutError(f"comando non terminato entro {deadline}s")
+                exit_code = channel.recv_exit_status()
+                stdout_text = stdout.read()
+                if encoding:
+                    stdout_text = stdout_text.decode(encoding, errors='replace')
                 stderr_text = stderr.read().decode('utf-8', errors='replace')
                 
                 return SSHResult(
@@ -92,6 +261,94 @@ class SSHService:
                     stderr=stderr_text,
                     exit_code=exit_code
                 )
+            except paramiko.ChannelException:
+                # Ritentato da _run
+                raise
+            except Exception as e:
+                logger.error(f"Errore esecuzione comando su {hostname}: {e}")
+                return SSHResult(
+                    success=False,
+                    stdout=empty_stdout,
+                    stderr=str(e),
+                    exit_code=-1
+                )
+        
+        return await self._run(hostname, port, username, key_path, _execute, empty_stdout)
+    
+    async def execute_stream(
+        self,
+        hostname: str,
+        command: str,
+        on_line: Callable[[str], None],
+        port: int = 22,
+        username: str = "root",
+        key_path: str = "/root/.ssh/id_rsa",
+        timeout: int = 300,
+        tail_lines: int = SSH_STREAM_TAIL_LINES,
+        deadline: Optional[float] = None
+    ) -> SSHResult:
+        """
+        Esegue un comando a lunga durata passando a on_line ogni riga di stdout appena arriva
+        (anche le righe di avanzamento terminate da \r). on_line è chiamata dal thread di
+        esecuzione. Lo stdout non viene accumulato: SSHResult.stdout contiene solo le ultime
+        tail_lines righe, sufficienti per la diagnostica in caso di errore.
+        Come per execute, solo con deadline il comando viene interrotto dopo deadline secondi.
+        """
+        def _execute():
+            channel = None
+            try:
+                stdout, stderr = self._open_command(hostname, port, username, key_path, command, timeout)
+                channel = stdout.channel
+                expires = time.monotonic() + deadline if deadline is not None else None
+                tail = deque(maxlen=tail_lines)
+                stderr_chunks = []
+                pending = b""
+                
+                def emit(raw: bytes):
+                    line = raw.decode('utf-8', errors='replace')
+                    tail.append(line)
+                    on_line(line)
+                
+                # stdout e stderr si svuotano appena hanno dati: uno stderr abbondante senza
+                # stdout non deve riempire la finestra SSH del canale e bloccare il comando
+                while True:
+                    while channel.recv_stderr_ready():
+                        stderr_chunks.append(channel.recv_stderr(SSH_STREAM_CHUNK_SIZE))
+                    if channel.recv_ready():
+                        chunk = channel.recv(SSH_STREAM_CHUNK_SIZE)
+                        *lines, pending = (pending + chunk).replace(b"\r", b"\n").split(b"\n")
+                        for raw in lines:
+                            if raw:
+                                emit(raw)
+                        continue
+                    # EOF arriva dopo tutti i dati: i buffer contengono già l'intero output.
+                    # Canale chiuso senza EOF (connessione persa): exit status -1
+                    if channel.eof_received or channel.closed:
+                        break
+                    remaining = None
+                    if expires is not None:
+                        remaining = expires - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError(f"comando non terminato entro {deadline}s")
+                    # Il fileno del canale diventa leggibile con dati su stdout o stderr e con l'EOF
+                    select.select([channel], [], [], remaining)
+                if pending:
+                    emit(pending)
+                stderr_chunks.append(stderr.read())
+                
+                if expires is not None and not channel.status_event.wait(max(expires - time.monotonic(), 0)):
+                    raise TimeoutError(f"comando non terminato entro {deadline}s")
+                exit_code = channel.recv_exit_status()
+                
+                return SSHResult(
+                    success=(exit_code == 0),
+                    stdout="\n".join(tail),
+                    stderr=b"".join(stderr_chunks).decode('utf-8', errors='replace'),
+                    exit_code=exit_code
+                )
+            except paramiko.ChannelException:
+                # Ritentato da _run
+                raise
             except Exception as e:
                 logger.error(f"Errore esecuzione comando su {hostname}: {e}")
                 return SSHResult(
@@ -100,9 +357,13 @@ class SSHService:
                     stderr=str(e),
                     exit_code=-1
                 )
+            finally:
+                # Chiuso anche se on_line solleva o scade la deadline: il canale non resta
+                # aperto nel pool con il comando remoto ancora attivo e non osservato
+                if channel is not None:
+                    channel.close()
         
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, _execute)
+        return await self._run(hostname, port, username, key_path, _execute, "")
     
     async def test_connection(
         self,
@@ -0,0 +1,270 @@
+"""
+Test HostInfoService parsers
+"""
+
+import copy
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from services import host_info_service as host_info_module
+from services.host_info_service import HostInfoService
+from services.ssh_service import SSHResult
+
+
+# Output di _collect_host_sections: "temperature" manca, "loadavg" e "storage_config" sono vuote
+HOST_SECTIONS_OUTPUT = (
+    b"\n==SEC node\n"
+    b"pve1\x1fpve-manager/8.2.4/faa83925c9641325 (running kernel: 6.8.8-2-pve)\x1f6.8.8-2-pve"
+    b"\n==SEC uptime\n"
+    b"123456.78 987654.32\n"
+    b"\n==SEC loadavg\n"
+    b"\n==SEC meminfo\n"
+    b"MemTotal:       65794000 kB\n"
+    b"MemFree:         1000000 kB\n"
+    b"MemAvailable:   32897000 kB\n"
+    b"SwapTotal:       8388604 kB\n"
+    b"SwapFree:        4194302 kB\n"
+    b"\n==SEC storage_config\n"
+    b"\n==SEC pvesm\n"
+    b"Name             Type     Status           Total            Used       Available        %\n"
+    b"local             dir     active        98497780        10485760        82962732   10.65%\n"
+    b"backup            nfs     active      1048576000       524288000       524288000   50.00%\n"
+)
+
+HOST_SECTION_NAMES = ["node", "uptime", "loadavg", "meminfo", "temperature", "storage_config", "pvesm"]
+
+CPUINFO_OUTPUT = "Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz|56|2|14|28\n"
+
+# Output di _METRICS_CMD: /proc via dd, interfaccia di default e head -v di /sys/block/*/stat
+METRICS_OUTPUT = """==STAT
+cpu  1000 0 500 8000 500 0 0 0 0 0
+cpu0 500 0 250 4000 250 0 0 0 0 0
+intr 12345
+==LOADAVG
+0.50 0.40 0.30 2/345 6789
+==MEMINFO
+MemTotal:       16384000 kB
+MemFree:         2048000 kB
+MemAvailable:    8192000 kB
+Buffers:          102400 kB
+Cached:          4096000 kB
+==NET vmbr0
+1000000
+2000000
+3000
+4000
+==> /sys/block/sda/stat <==
+     100        0     2048       10      200        0     4096       20        0       30       30
+
+==> /sys/block/nvme0n1/stat <==
+      50        0     1024        5       20        0      512        2        0        7        7
+"""
+
+
+@pytest.fixture
+def service():
+    """Fresh HostInfoService (no cached facts or CPU samples)"""
+    return HostInfoService()
+
+
+async def collect_sections(service, stdout):
+    """Run _collect_host_sections against a mocked SSH result"""
+    with patch.object(host_info_module, "ssh_service") as ssh:
+        ssh.execute = AsyncMock(return_value=SSHResult(True, stdout, b"", 0))
+        sections = await service._collect_host_sections(
+            "pve1", 22, "root", "/root/.ssh/id_rsa", HOST_SECTION_NAMES
+        )
+    return sections, ssh.execute
+
+
+def parse_metrics(service, output, hostname="pve1"):
+    """Parse _METRICS_CMD output into a fresh metrics dict"""
+    metrics = copy.deepcopy(host_info_module._METRICS_TEMPLATE)
+    net_dev = service._parse_metrics(hostname, output, metrics)
+    return net_dev, metrics
+
+
+class TestHostSections:
+    """Test single-command host sections and their parser"""
+
+    @pytest.mark.asyncio
+    async def test_collect_splits_sections(self, service):
+        """Test each ==SEC marker becomes a section, including empty ones"""
+        sections, execute = await collect_sections(service, HOST_SECTIONS_OUTPUT)
+
+        assert execute.await_count == 1
+        command = execute.call_args.args[1]
+        for name in HOST_SECTION_NAMES:
+            assert f"==SEC {name}" in command
+
+        assert set(sections) == {"node", "uptime", "loadavg", "meminfo", "storage_config", "pvesm"}
+        assert sections["loadavg"] == b""
+        assert sections["storage_config"] == b""
+        assert sections["uptime"] == b"123456.78 987654.32\n"
+
+    @pytest.mark.asyncio
+    async def test_collect_ssh_error(self, service):
+        """Test SSH failure returns no sections"""
+        with patch.object(host_info_module, "ssh_service") as ssh:
+            ssh.execute = AsyncMock(side_effect=OSError("connection refused"))
+            sections = await service._collect_host_sections(
+                "pve1", 22, "root", "/root/.ssh/id_rsa", HOST_SECTION_NAMES
+            )
+
+        assert sections == {}
+
+    @pytest.mark.asyncio
+    async def test_parse_sections(self, service):
+        """Test parsed details with a missing and an empty section"""
+        sections, _ = await collect_sections(service, HOST_SECTIONS_OUTPUT)
+        facts = {
+            "node": service._parse_fact("node", sections["node"]),
+            "cpuinfo": service._parse_cpuinfo(CPUINFO_OUTPUT)
+        }
+
+        data = service._parse_host_sections(
+            "pve1", sections, facts,
+            include_hardware=True, include_storage=True, include_network=False
+        )
+
+        assert data["node_name"] == "pve1"
+        assert data["proxmox_version"] == "8.2.4"
+        assert data["kernel_version"] == "6.8.8-2-pve"
+        assert data["uptime_seconds"] == 123456
+        # loadavg vuota: nessun campo load
+        assert data["cpu"] == {
+            "model": "Intel(R) Xeon(R) CPU E5-2680 v4 @ 2.40GHz",
+            "cores": 56,
+            "sockets": 2,
+            "threads_per_core": 2,
+            "threads": 112
+        }
+        assert data["memory"] == {
+            "total_gb": 62.75,
+            "free_gb": 0.95,
+            "available_gb": 31.37,
+            "used_gb": 31.38,
+            "swap_total_gb": 8.0,
+            "swap_free_gb": 4.0,
+            "swap_used_gb": 4.0
+        }
+        # temperature mancante
+        assert "temperature" not in data
+        assert "network" not in data
+        # storage_config vuota: shared dedotto dal tipo
+        assert data["storage"] == [
+            {
+                "name": "local", "type": "dir", "status": "active",
+                "total_gb": 93.93, "used_gb": 10.0, "available_gb": 79.12,
+                "used_percent": 10.65, "content": "", "shared": False
+            },
+            {
+                "name": "backup", "type": "nfs", "status": "active",
+                "total_gb": 1000.0, "used_gb": 500.0, "available_gb": 500.0,
+                "used_percent": 50.0, "content": "", "shared": True
+            }
+        ]
+
+    def test_parse_no_sections(self, service):
+        """Test all sections missing (collection failed)"""
+        data = service._parse_host_sections(
+            "pve1", {}, {},
+            include_hardware=True, include_storage=True, include_network=True
+        )
+
+        assert data == {
+            "node_name": "pve1",
+            "proxmox_version": None,
+            "kernel_version": None,
+            "uptime_seconds": None
+        }
+
+    def test_parse_cpuinfo_without_physical_id(self, service):
+        """Test ARM cpuinfo summary defaults to one socket"""
+        cpu = service._parse_cpuinfo("ARMv7 Processor rev 4 (v7l)|4|||\n")
+
+        assert cpu == {"model": "ARMv7 Processor rev 4 (v7l)", "cores": 4, "sockets": 1, "threads": 4}
+
+
+class TestMetrics:
+    """Test _METRICS_CMD output parser"""
+
+    def test_parse_metrics(self, service):
+        """Test first sample with all sections present"""
+        net_dev, metrics = parse_metrics(service, METRICS_OUTPUT)
+
+        assert net_dev == "vmbr0"
+        assert metrics["cpu"] == {
+            "usage_percent": 15.0,
+            "load_1min": 0.5,
+            "load_5min": 0.4,
+            "load_15min": 0.3
+        }
+        assert metrics["memory"] == {
+            "usage_percent": 50.0,
+            "used_gb": 7.81,
+            "total_gb": 15.62,
+            "available_gb": 7.81
+        }
+        assert metrics["network"]["interfaces"] == [{
+            "name": "vmbr0",
+            "rx_bytes": 1000000,
+            "tx_bytes": 2000000,
+            "rx_packets": 3000,
+            "tx_packets": 4000
+        }]
+        # sda + nvme0n1, settori da 512 byte
+        assert metrics["disk"] == {
+            "io_read_ops": 150,
+            "io_read_bytes": 3072 * 512,
+            "io_write_ops": 220,
+            "io_write_bytes": 4608 * 512
+        }
+
+    def test_cpu_usage_from_previous_sample(self, service):
+        """Test CPU usage is computed on the delta between samples"""
+        parse_metrics(service, METRICS_OUTPUT)
+        _, metrics = parse_metrics(
+            service, METRICS_OUTPUT.replace("cpu  1000 0 500 8000 500", "cpu  1600 0 700 8900 600")
+        )
+
+        # 800 jiffies attivi su 1800
+        assert metrics["cpu"]["usage_percent"] == 44.44
+
+    def test_parse_metrics_missing_sections(self, service):
+        """Test empty LOADAVG/NET, no MemAvailable and no disks"""
+        output = (
+            "==STAT\ncpu  10 0 10 80 0 0 0 0\n"
+            "==LOADAVG\n"
+            "==MEMINFO\nMemTotal: 1048576 kB\nMemFree: 209715 kB\nBuffers: 104858 kB\nCached: 209715 kB\n"
+            "==NET \n"
+        )
+        net_dev, metrics = parse_metrics(service, output)
+
+        assert net_dev == ""
+        assert metrics["cpu"] == {
+            "usage_percent": 20.0,
+            "load_1min": 0.0,
+            "load_5min": 0.0,
+            "load_15min": 0.0
+        }
+        # Senza MemAvailable: libera + buffers + cache
+        assert metrics["memory"]["total_gb"] == 1.0
+        assert metrics["memory"]["available_gb"] == 0.5
+        assert metrics["network"]["interfaces"] == [{
+            "name": "unknown",
+            "rx_bytes": 0,
+            "tx_bytes": 0,
+            "rx_packets": 0,
+            "tx_packets": 0
+        }]
+        assert metrics["disk"] == host_info_module._METRICS_TEMPLATE["disk"]
+
+    def test_parse_metrics_empty_output(self, service):
+        """Test empty output leaves the template values"""
+        net_dev, metrics = parse_metrics(service, "")
+
+        assert net_dev == ""
+        assert metrics["cpu"] == host_info_module._METRICS_TEMPLATE["cpu"]
+        assert metrics["memory"] == host_info_module._METRICS_TEMPLATE["memory"]